@@ -33,6 +33,12 @@ This will also scan the scripts for a title and some documentation.
 The title must be on the first line of the script and it must be preceeded by a #.
 Documentation will be read as the first triple quoted string in the script.
 This info will be displayed in the UI when a script is selected.
+Only the titles are read when the browser opens. The documentation is read
+when a script is selected and in the background for the selected category.
+The titles and documentation are cached in a file in your home directory so
+that only new and changed scripts have to be read the next time. The compiled
+scripts are cached as well so that they don't have to be compiled every time
+they are run.
 
 THIS SCRIPT IS SUPPLIED AS IS. NO WARRANTEES. NO GUARANTEES. NO QUESTIONS.
 (C) 2005 Tal Leming
@@ -48,8 +54,20 @@ SCRIPT_DIRECTORY = None
 import os
 import sys
 import re
+import imp
+import marshal
 from FL import *
 
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+try:
+    import threading
+except ImportError:
+    threading = None
+
 assert SCRIPT_DIRECTORY is not None, "Path to script directory is undefined!"
 if isinstance(SCRIPT_DIRECTORY, list):
     for p in SCRIPT_DIRECTORY:
@@ -61,30 +79,70 @@ else:
 ## functions for loading data from scripts
 ##
 
-def runScriptDirectory(path):
+# the number of directories that are scanned at the same time
+SCAN_THREADS = 8
+
+def mapThreaded(function, items, threadCount=SCAN_THREADS):
+    """call function with each item on several threads and return the results in order"""
+    if threading is None or threadCount < 2 or len(items) < 2:
+        return [function(item) for item in items]
+    results = [None] * len(items)
+    pending = range(len(items))
+    errors = []
+    lock = threading.Lock()
+    def work():
+        while True:
+            lock.acquire()
+            try:
+                if not pending or errors:
+                    return
+                index = pending.pop(0)
+            finally:
+                lock.release()
+            try:
+                results[index] = function(items[index])
+            except:
+                errors.append(sys.exc_info())
+    threads = [threading.Thread(target=work) for i in range(min(threadCount, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        errorType, error, traceback = errors[0]
+        raise errorType, error, traceback
+    return results
+
+def runScriptDirectory(path, cache=None):
     """run through a directory and get script from each sub directory"""
     sections = {}
     if isinstance(path, list):
-        for p in path:
-            for section, scripts in runScriptDirectory(p).items():
+        # the directories are scanned at the same time but
+        # merged in order so later directories take precedence
+        found = mapThreaded(lambda p: runScriptDirectory(p, cache), path)
+        for pathSections in found:
+            for section, scripts in pathSections.items():
                 if section not in sections:
                     sections[section] = {}
                 sections[section].update(scripts)
     else:
+        subDirectories = []
         for fileName in os.listdir(path):
             if fileName.startswith("."):
                 continue
             fullPath = os.path.join(path, fileName)
             if os.path.isdir(fullPath):
-                found = runSubDirectory(fullPath)
-                if fileName in sections:
-                    sections[fileName].extend(found)
-                else:
-                    sections[fileName] = found
+                subDirectories.append((fileName, fullPath))
+        found = mapThreaded(lambda item: runSubDirectory(item[1], cache), subDirectories)
+        for (fileName, fullPath), scripts in zip(subDirectories, found):
+            if fileName in sections:
+                sections[fileName].update(scripts)
+            else:
+                sections[fileName] = scripts
     return sections
 
-def runSubDirectory(path):
-    """run through a directory of scripts and gather information about each script"""
+def runSubDirectory(path, cache=None):
+    """run through a directory of scripts and get the title and path of each script"""
     scripts = {}
     for fileName in os.listdir(path):
         if fileName.startswith("."):
@@ -92,44 +150,302 @@ def runSubDirectory(path):
         base, ext = os.path.splitext(fileName)
         if ext.lower() == ".py":
             fullPath = os.path.join(path, fileName)
-            title, doc = scanScript(fullPath)
+            if cache is None:
+                title = scanTitle(fullPath)
+            else:
+                title = cache.getTitle(fullPath)
             if title is None or len(title) == 0:
                 title = base
-            if doc is None:
-                doc = ""
-            scripts[title] = (doc, fullPath)
+            scripts[title] = fullPath
     return scripts
 
 doc_RE = re.compile(
-        "[\"\']{3}" # triple quote
-        "([\S\s]*)" # text
-        "[\"\']{3}" # triple quote
+        "(\"\"\"|\'\'\')" # triple quote
+        "([\S\s]*?)" # text
+        "\\1" # the same triple quote
         )
 title_RE = re.compile(
         "#\s*"
         "(.*)"
         )
 
-def scanScript(path):
+# the number of bytes at the start of a script
+# that are searched for the documentation
+SCAN_LIMIT = 65536
+SCAN_BLOCK_SIZE = 4096
+# the number of bytes read to find the title
+TITLE_LIMIT = 1024
+
+def findTitle(text):
+    """get the title from the first line of the text"""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    titleSearch = title_RE.match(text)
+    if titleSearch is None:
+        return None
+    title = titleSearch.group(1)
+    if title[:4] == "FLM:":
+        title = title[4:]
+    return title.strip()
+
+def scanTitle(path):
+    """get the title from the script"""
+    f = open(path, "rb")
+    try:
+        text = f.read(TITLE_LIMIT)
+    finally:
+        f.close()
+    return findTitle(text)
+
+def scanScript(path, limit=SCAN_LIMIT):
     """get the title and documentation from the script"""
     title = None
     doc = None
+    # read until the end of the first triple quoted string
+    text = ""
     f = open(path, "rb")
-    text = f.read().replace("\r\n", "\n").replace("\r", "\n")
-    f.close()
+    try:
+        while len(text) < limit:
+            block = f.read(min(SCAN_BLOCK_SIZE, limit - len(text)))
+            if not block:
+                break
+            text += block
+            docSearch = doc_RE.search(text)
+            if docSearch is not None:
+                break
+    finally:
+        f.close()
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
     # extract doc
-    docSearch = doc_RE.findall(text)
-    if docSearch:
-        doc = docSearch[0].strip()
+    docSearch = doc_RE.search(text)
+    if docSearch is not None:
+        doc = docSearch.group(2).strip()
     # extract name
-    titleSearch = title_RE.match(text)
-    if titleSearch is not None:
-        title = titleSearch.group(1)
-        if title[:4] == "FLM:":
-            title = title[4:]
-        title = title.strip()
+    title = findTitle(text)
     return title, doc
 
+##
+## the script cache
+##
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".ScriptBrowserCache")
+CACHE_VERSION = 2
+
+class ScriptCache:
+
+    """
+    The title and documentation of each script keyed by path.
+    The documentation is only read when it is first needed.
+    A script is only read again if its modification time or
+    size has changed. Scripts that are not looked up before
+    the cache is saved are dropped from it. Scripts can be
+    looked up from several threads at once. If path is None
+    nothing is loaded or saved.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self.found = {}
+        self.changed = False
+        self._prefetchPaths = []
+        self._prefetchThread = None
+        self._prefetchLock = None
+        if threading is not None:
+            self._prefetchLock = threading.Lock()
+        if path is None:
+            return
+        try:
+            f = open(path, "rb")
+            try:
+                data = marshal.load(f)
+            finally:
+                f.close()
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data["scripts"]
+        except (IOError, EOFError, ValueError, TypeError, AttributeError, KeyError):
+            # a missing or damaged cache is rebuilt
+            pass
+
+    def _getEntry(self, path):
+        # entries are (stamp, title, doc). doc is None
+        # until the documentation has been read.
+        stat = os.stat(path)
+        stamp = (stat.st_mtime, stat.st_size)
+        entry = self.found.get(path)
+        if entry is None:
+            entry = self.entries.get(path)
+        if entry is not None and entry[0] != stamp:
+            entry = None
+        return stamp, entry
+
+    def getTitle(self, path):
+        stamp, entry = self._getEntry(path)
+        if entry is None:
+            entry = (stamp, scanTitle(path), None)
+            self.changed = True
+        self.found[path] = entry
+        return entry[1]
+
+    def getDoc(self, path):
+        stamp, entry = self._getEntry(path)
+        if entry is None or entry[2] is None:
+            title, doc = scanScript(path)
+            if doc is None:
+                doc = ""
+            entry = (stamp, title, doc)
+            self.changed = True
+        self.found[path] = entry
+        return entry[2]
+
+    def prefetchDocs(self, paths):
+        """read the documentation of the scripts in the background"""
+        if threading is None:
+            return
+        self._prefetchLock.acquire()
+        try:
+            # earlier requests are dropped
+            self._prefetchPaths = list(paths)
+            if self._prefetchThread is None:
+                self._prefetchThread = threading.Thread(target=self._prefetch)
+                self._prefetchThread.setDaemon(True)
+                self._prefetchThread.start()
+        finally:
+            self._prefetchLock.release()
+
+    def _prefetch(self):
+        while True:
+            self._prefetchLock.acquire()
+            try:
+                if not self._prefetchPaths:
+                    self._prefetchThread = None
+                    return
+                path = self._prefetchPaths.pop(0)
+            finally:
+                self._prefetchLock.release()
+            try:
+                self.getDoc(path)
+            except (IOError, OSError):
+                # the script will be read again when it is selected
+                pass
+
+    def save(self):
+        """write the scripts that were found to the cache file"""
+        if self.path is None:
+            return
+        if not self.changed and len(self.found) == len(self.entries):
+            return
+        data = dict(version=CACHE_VERSION, scripts=self.found)
+        tempPath = self.path + ".tmp"
+        try:
+            f = open(tempPath, "wb")
+            try:
+                marshal.dump(data, f)
+            finally:
+                f.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tempPath, self.path)
+        except (IOError, OSError):
+            # the cache is only an optimization
+            pass
+        self.entries = dict(self.found)
+        self.changed = False
+
+##
+## the bytecode cache
+##
+
+BYTECODE_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".ScriptBrowserBytecode")
+BYTECODE_CACHE_SUFFIX = ".bytecode"
+
+def compileScript(path):
+    """compile a script"""
+    f = open(path, 'rb')
+    data = '\n'.join(f.read().splitlines()) + '\n'
+    f.close()
+    return compile(data, path, "exec")
+
+def _getBytecodePath(path, directory):
+    return os.path.join(directory, md5(path).hexdigest() + BYTECODE_CACHE_SUFFIX)
+
+def _getScriptStamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+def _readBytecodeFile(bytecodePath):
+    # returns (path, stamp, code) or None if the
+    # file was written by a different version of python
+    f = open(bytecodePath, "rb")
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    magic = imp.get_magic()
+    if data[:len(magic)] != magic:
+        return None
+    return marshal.loads(data[len(magic):])
+
+def readBytecodeCache(path, directory=BYTECODE_CACHE_DIRECTORY):
+    """get the cached code for a script or None if it isn't cached or the script has changed"""
+    bytecodePath = _getBytecodePath(path, directory)
+    if not os.path.exists(bytecodePath):
+        return None
+    entry = _readBytecodeFile(bytecodePath)
+    if entry is None:
+        return None
+    cachedPath, stamp, code = entry
+    if cachedPath != path or stamp != _getScriptStamp(path):
+        return None
+    return code
+
+def writeBytecodeCache(path, code, directory=BYTECODE_CACHE_DIRECTORY):
+    """cache the code for a script"""
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    bytecodePath = _getBytecodePath(path, directory)
+    tempPath = bytecodePath + ".tmp"
+    f = open(tempPath, "wb")
+    try:
+        f.write(imp.get_magic())
+        f.write(marshal.dumps((path, _getScriptStamp(path), code)))
+    finally:
+        f.close()
+    if os.path.exists(bytecodePath):
+        os.remove(bytecodePath)
+    os.rename(tempPath, bytecodePath)
+
+def pruneBytecodeCache(directory=BYTECODE_CACHE_DIRECTORY):
+    """remove the cached code for scripts that no longer exist or for other versions of python"""
+    if not os.path.exists(directory):
+        return
+    for fileName in os.listdir(directory):
+        bytecodePath = os.path.join(directory, fileName)
+        try:
+            if fileName.endswith(BYTECODE_CACHE_SUFFIX):
+                entry = _readBytecodeFile(bytecodePath)
+                if entry is not None and os.path.exists(entry[0]):
+                    continue
+            os.remove(bytecodePath)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            pass
+
+def loadScriptCode(path):
+    """get the code for a script from the cache or by compiling it"""
+    # any problem with the cache falls back to the source
+    code = None
+    try:
+        code = readBytecodeCache(path)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+    if code is None:
+        code = compileScript(path)
+        try:
+            writeBytecodeCache(path, code)
+            pruneBytecodeCache()
+        except (IOError, OSError, ValueError):
+            pass
+    return code
+
 ##
 ## the UI
 ##
@@ -148,7 +464,9 @@ class ScriptBrowser:
         self.d.Center()
         self.d.title = "ScriptBrowser"
 
-        self.scriptDict = runScriptDirectory(scriptDirectory)
+        self.cache = ScriptCache()
+        self.scriptDict = runScriptDirectory(scriptDirectory, self.cache)
+        self.cache.save()
         self.category_select = self.scriptDict.keys()
         self.category_select.sort()
         self.category_select_index = None
@@ -163,6 +481,8 @@ class ScriptBrowser:
         self.d.AddControl(STATICCONTROL, Rect(15, height-100, width-15, height-60), "doc_label", STYLE_LABEL, "Documentation...")
 
         self.d.Run()
+        # keep the documentation that was read
+        self.cache.save()
 
     def on_category_select(self, code):
         self.d.GetValue("category_select")
@@ -171,13 +491,15 @@ class ScriptBrowser:
             self.script_select = self.scriptDict[self.category].keys()
             self.script_select.sort()
             self.d.PutValue("script_select")
+            self.cache.prefetchDocs([self.scriptDict[self.category][name] for name in self.script_select])
 
     def on_script_select(self, code):
         self.d.GetValue("script_select")
         if self.script_select_index != "-1":
             name = self.script_select[int(self.script_select_index)]
-            self.selected = self.scriptDict[self.category][name]
-            doc, path = self.selected
+            path = self.scriptDict[self.category][name]
+            doc = self.cache.getDoc(path)
+            self.selected = (doc, path)
             self.doc_label = doc
             self.selected_label = name
             self.d.PutValue("doc_label")
@@ -198,10 +520,8 @@ class ScriptBrowser:
                         "__name__" : "__main__",
                         }
                 
-                f = open(path, 'rb')
-                data = '\n'.join(f.read().splitlines()) + '\n'
-                f.close()
-                exec data in namespace
+                code = loadScriptCode(path)
+                exec code in namespace
             finally:
                 sys.argv = saveArgv
                 os.chdir(saveChdir)
@@ -51,6 +51,12 @@ Check to write data into existing UFO or VFB files.
 The file name will be exported or imported except
 that it will have a different file suffix.
 
+Only Changed Glyphs
+Check to only write the glyphs that have changed
+since the last export into an existing UFO or the
+last import into an existing VFB. The first export
+or import writes all glyphs.
+
 
 Data Options
 ------------
@@ -73,33 +79,120 @@ Check to read/write hint data.
 Glyphs
 This button brings up a dialog that will allow
 you to select which glyphs should be exported
-or imported.
+or imported. Add Components adds the glyphs that
+the selected glyphs use as components. Add
+Composites adds the glyphs that use the selected
+glyphs as components.
 
 Glyph Marks
 Check to read/write glyph marks.
 
 Glyph Masks
 Check to read/write glyph masks.
+
+Subset Kerning
+Check to only export the kerning pairs and groups
+that involve the selected glyphs. When writing
+into existing files they are merged with the
+kerning and groups that are already there.
+
+Compact Masks
+Check to write glyph masks in a compact form.
+This makes the .glif files smaller and faster to
+read and write. Older versions of this script
+can not read masks written in this form.
+
+Report Timings
+Check to print the time spent on each part of
+the import or export to the output window when
+all files have been processed.
+
+Resume Interrupted Batch
+Check to record the files as they are completed
+and to skip the files that were completed before
+the last batch run with this checked was
+interrupted. Files are only skipped if they and
+the options haven't changed. Unsaved changes to
+open fonts are not noticed.
+
+The progress of the batch is shown in the output
+window. Pressing Cancel in the progress bar stops
+the batch. A file that is being exported is
+abandoned before anything is written for it and
+a file that is being imported is completed. The
+files exported before it are still written.
+
+
+Batches
+-------
+
+Exports and imports can be run without this
+interface by passing a job file to runJobFile.
+A job file is a plist listing the UFO or VFB
+paths and the options to use for each of them.
+The completed jobs are recorded in a journal
+next to the job file and an interrupted batch
+can be resumed by passing resume=True to
+runJobFile. The progress is written to a log
+file next to the job file. To cancel the batch,
+create a file with the name of the job file and
+a .cancel extension.
 """.strip()
 
 
 import os
-from copy import deepcopy
-from robofab.ufoLib import UFOReader, UFOWriter
+import sys
+import re
+import time
+import shutil
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+from array import array
+from itertools import chain
+from robofab.ufoLib import UFOReader, UFOWriter, fontInfoAttributesVersion2
 from robofab.pens.pointPen import AbstractPointPen
+from robofab.objects.objectsBase import postScriptHintDataLibKey
 from robofab.world import AllFonts, CurrentFont, CurrentGlyph, OpenFont, NewFont
 from robofab.interface.all.dialogs import Message
 from robofab.plistlib import readPlist, writePlist
-from robofab.objects.objectsFL import _dictHintsToGlyph, postScriptHintDataLibKey, PostScriptFontHintValues, _glyphHintsToDict
-import dialogKit
-from FL import *
-import fl_cmd
+from robofab.tools.glyphNameSchemes import glyphNameToShortFileName
+try:
+    from robofab.objects.objectsFL import _dictHintsToGlyph, PostScriptFontHintValues, _glyphHintsToDict
+    from robofab.objects.objectsFL import RGlyph as RGlyphFL
+    from robofab.pens.flPen import FLPointPen
+    from robofab.objects import objectsFL
+    import dialogKit
+    from FL import *
+    import fl_cmd
+except ImportError:
+    # not running in FontLab. the interface and the
+    # FontLab backend are not available, but batches
+    # can be run with a stand-in backend.
+    dialogKit = None
 
 try:
     set
 except NameError:
     from sets import Set as set
 
+try:
+    import threading
+    import Queue
+except ImportError:
+    # exports are written and imports are
+    # parsed on the main thread
+    threading = None
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
 
 # ---------
 # Interface
@@ -123,6 +216,7 @@ class MainDialog(object):
         self.mode = "import"
         self.files = {}
         self.glyphs = None
+        self.backend = FontLabBackend()
         self.quickModes = [
             quickMode_import_selectedFiles_everything,
             quickMode_export_allFonts_everything,
@@ -157,6 +251,8 @@ class MainDialog(object):
 
         self.w.destinationNewFilesCheckBox = dialogKit.CheckBox((240, 309, 170, 20), "Make New Files", value=True, callback=self.destinationFilesCallback)
         self.w.destinationExistingFilesCheckBox = dialogKit.CheckBox((240, 332, 170, 20), "Write Into Existing Files", callback=self.destinationFilesCallback)
+        self.w.destinationChangedGlyphsCheckBox = dialogKit.CheckBox((255, 355, 155, 20), "Only Changed Glyphs")
+        self.w.destinationChangedGlyphsCheckBox.enable(False)
 
         self.w.line3 = dialogKit.VerticalLine((420, 59, 1, -60))
 
@@ -170,6 +266,10 @@ class MainDialog(object):
         self.w.doGlyphMarksCheckBox = dialogKit.CheckBox((435, 212, -12, 20), "Glyph Marks")
         self.w.doGlyphMasksCheckBox = dialogKit.CheckBox((435, 235, -12, 20), "Glyph Masks")
         self.w.doGlyphHintsCheckBox = dialogKit.CheckBox((435, 258, -12, 20), "Glyph Hints", value=False)
+        self.w.compactGlyphMasksCheckBox = dialogKit.CheckBox((435, 281, -12, 20), "Compact Masks", value=False)
+        self.w.reportTimingsCheckBox = dialogKit.CheckBox((435, 309, -12, 20), "Report Timings", value=False)
+        self.w.resumeCheckBox = dialogKit.CheckBox((435, 332, -12, 20), "Resume Interrupted Batch", value=False)
+        self.w.subsetKerningCheckBox = dialogKit.CheckBox((435, 355, -12, 20), "Subset Kerning", value=False)
 
         self.w.helpButton = dialogKit.Button((12, -32, 70, 20), "Help", callback=self.showHelpCallback)
 
@@ -217,6 +317,7 @@ class MainDialog(object):
             self.w.destinationExistingFilesCheckBox.set(not sender.get())
         else:
             self.w.destinationNewFilesCheckBox.set(not sender.get())
+        self.w.destinationChangedGlyphsCheckBox.enable(self.w.destinationExistingFilesCheckBox.get())
 
     def showHelpCallback(self, sender):
         HelpDialog()
@@ -241,6 +342,8 @@ class MainDialog(object):
             # destination
             self.w.destinationNewFilesCheckBox.set(True)
             self.w.destinationExistingFilesCheckBox.set(False)
+            self.w.destinationChangedGlyphsCheckBox.set(False)
+            self.w.destinationChangedGlyphsCheckBox.enable(False)
             # parts
             self.w.doFontInfoCheckBox.set(True)
             self.w.doKerningCheckBox.set(True)
@@ -251,6 +354,8 @@ class MainDialog(object):
             self.w.doGlyphMarksCheckBox.set(False)
             self.w.doGlyphMasksCheckBox.set(False)
             self.w.doGlyphHintsCheckBox.set(False)
+            self.w.compactGlyphMasksCheckBox.set(False)
+            self.w.subsetKerningCheckBox.set(False)
             glyphs = None
         elif mode == quickMode_export_allFonts_everything:
             # import
@@ -266,6 +371,8 @@ class MainDialog(object):
             # destination
             self.w.destinationNewFilesCheckBox.set(True)
             self.w.destinationExistingFilesCheckBox.set(False)
+            self.w.destinationChangedGlyphsCheckBox.set(False)
+            self.w.destinationChangedGlyphsCheckBox.enable(False)
             # parts
             self.w.doFontInfoCheckBox.set(True)
             self.w.doKerningCheckBox.set(True)
@@ -276,6 +383,8 @@ class MainDialog(object):
             self.w.doGlyphMarksCheckBox.set(False)
             self.w.doGlyphMasksCheckBox.set(False)
             self.w.doGlyphHintsCheckBox.set(False)
+            self.w.compactGlyphMasksCheckBox.set(False)
+            self.w.subsetKerningCheckBox.set(False)
             glyphs = None
         elif mode == quickMode_export_currentFont_selectedGlyphs:
             # import
@@ -291,6 +400,8 @@ class MainDialog(object):
             # destination
             self.w.destinationNewFilesCheckBox.set(False)
             self.w.destinationExistingFilesCheckBox.set(True)
+            self.w.destinationChangedGlyphsCheckBox.set(False)
+            self.w.destinationChangedGlyphsCheckBox.enable(True)
             # parts
             self.w.doFontInfoCheckBox.set(False)
             self.w.doKerningCheckBox.set(False)
@@ -301,6 +412,8 @@ class MainDialog(object):
             self.w.doGlyphMarksCheckBox.set(False)
             self.w.doGlyphMasksCheckBox.set(False)
             self.w.doGlyphHintsCheckBox.set(False)
+            self.w.compactGlyphMasksCheckBox.set(False)
+            self.w.subsetKerningCheckBox.set(True)
             font = CurrentFont()
             if font is None:
                 glyphs = None
@@ -385,9 +498,7 @@ class MainDialog(object):
                     font.path : font
                 }
         else:
-            self.files = {}
-            for font in AllFonts():
-                self.files[font.path] = font
+            self.files = self.backend.getOpenFontsByPath()
         self._updateFileList()
 
     def exportFormatSelectionCallback(self, sender):
@@ -407,7 +518,7 @@ class MainDialog(object):
     # --------------
 
     def editGlyphsCallback(self, sender):
-        GlyphsDialog(self.files, self.glyphs, self.mode, self._editGlyphsFinishedCallback)
+        GlyphsDialog(self.files, self.glyphs, self.mode, self._editGlyphsFinishedCallback, backend=self.backend)
 
     def _editGlyphsFinishedCallback(self, selectedGlyphs, unselectedGlyphs):
         if not len(unselectedGlyphs):
@@ -429,46 +540,394 @@ class MainDialog(object):
         doGlyphHints = self.w.doGlyphHintsCheckBox.get()
         doGlyphMarks = self.w.doGlyphMarksCheckBox.get()
         doGlyphMasks = self.w.doGlyphMasksCheckBox.get()
+        compactMasks = self.w.compactGlyphMasksCheckBox.get()
+        subsetKerning = self.w.subsetKerningCheckBox.get()
         formatVersion = 2
         if self.w.exportFormatVersion1CheckBox.get():
             formatVersion = 1
 
         newFile = self.w.destinationNewFilesCheckBox.get()
+        onlyChangedGlyphs = not newFile and self.w.destinationChangedGlyphsCheckBox.get()
 
+        options = dict(newFile=newFile, doInfo=doInfo, doKerning=doKerning, doGroups=doGroups, doLib=doLib, doFeatures=doFeatures,
+            doHints=doGlyphHints, doMarks=doGlyphMarks, doMasks=doGlyphMasks, glyphs=self.glyphs, onlyChangedGlyphs=onlyChangedGlyphs)
         if self.mode == "export":
-            for path, font in self.files.items():
-                exportUFO(font, newFile, doInfo=doInfo, doKerning=doKerning, doGroups=doGroups, doLib=doLib, doFeatures=doFeatures,
-                    doHints=doGlyphHints, doMarks=doGlyphMarks, doMasks=doGlyphMasks, glyphs=self.glyphs, formatVersion=formatVersion)
+            options["formatVersion"] = formatVersion
+            options["compactMasks"] = compactMasks
+            options["subsetKerning"] = subsetKerning
         else:
-            saveFile = self.w.saveVFBCheckBox.get()
-            closeFile = self.w.closeVFBCheckBox.get()
-            for path in self.files.keys():
-                importUFO(path, newFile, saveFile, closeFile, doInfo=doInfo, doKerning=doKerning, doGroups=doGroups, doLib=doLib, doFeatures=doFeatures,
-                    doHints=doGlyphHints, doMarks=doGlyphMarks, doMasks=doGlyphMasks, glyphs=self.glyphs)
+            options["saveFile"] = self.w.saveVFBCheckBox.get()
+            options["closeFile"] = self.w.closeVFBCheckBox.get()
+        jobs = []
+        for path, font in self.files.items():
+            job = dict(options)
+            job["mode"] = self.mode
+            job["path"] = path
+            if font is not None:
+                job["font"] = font
+            jobs.append(job)
+        timer = None
+        if self.w.reportTimingsCheckBox.get():
+            timer = PhaseTimer()
+        # the completed jobs are only recorded when resuming
+        journal = None
+        if self.w.resumeCheckBox.get():
+            journal = BatchJournal(DIALOG_JOURNAL_PATH, resume=True)
+        try:
+            runJobs(jobs, backend=self.backend, timer=timer, journal=journal, progress=BatchProgress())
+        except BatchCancelled:
+            if journal is None:
+                self.backend.message("The batch was cancelled.")
+            else:
+                self.backend.message("The batch was cancelled. Run it again to continue it.")
+        else:
+            # runJobs removes the journal it was given once the
+            # batch is done. a batch that finishes without one
+            # leaves nothing to resume, so an older one goes too.
+            if journal is None and os.path.exists(DIALOG_JOURNAL_PATH):
+                os.remove(DIALOG_JOURNAL_PATH)
+        if timer is not None:
+            print timer.report()
+
+
+class GlyphNameIndex(object):
+
+    """
+    A cache of the glyph names in UFOs. The names for a UFO
+    are only read again when the modification time or size
+    of its contents.plist changes. The unicodes and component
+    bases are read again when a .glif file has been added,
+    removed or modified since they were read. The least
+    recently used UFOs are dropped when more than maxSize
+    are cached.
+    """
+
+    def __init__(self, maxSize=200):
+        self.maxSize = maxSize
+        self._entries = {}
+        self._order = []
+
+    def _touch(self, path):
+        if path in self._entries:
+            self._order.remove(path)
+        self._order.append(path)
+        while len(self._order) > self.maxSize:
+            del self._entries[self._order.pop(0)]
+
+    def _forget(self, path):
+        if path in self._entries:
+            del self._entries[path]
+            self._order.remove(path)
+
+    def getGlyphNames(self, path):
+        contentsPath = os.path.join(path, "glyphs", "contents.plist")
+        if not os.path.exists(contentsPath):
+            self._forget(path)
+            return None
+        stat = os.stat(contentsPath)
+        stamp = (stat.st_mtime, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != stamp:
+            entry = [stamp, readPlist(contentsPath).keys(), None, None, None]
+        self._touch(path)
+        self._entries[path] = entry
+        return entry[1]
+
+    def _getGlifEntry(self, path):
+        # the entry for a UFO with the data read from the
+        # .glif files dropped if any of them have changed
+        if self.getGlyphNames(path) is None:
+            return None
+        entry = self._entries[path]
+        glyphsDirectory = os.path.join(path, "glyphs")
+        newest = 0
+        count = 0
+        for fileName in os.listdir(glyphsDirectory):
+            if fileName.endswith(".glif"):
+                newest = max(newest, os.path.getmtime(os.path.join(glyphsDirectory, fileName)))
+                count += 1
+        glifStamp = (newest, count)
+        if entry[4] != glifStamp:
+            entry[2] = None
+            entry[3] = None
+            entry[4] = glifStamp
+        return entry
+
+    def getUnicodes(self, path):
+        # the unicode values are only needed for filtering
+        # so they are read from the .glif files on demand
+        # and cached along with the glyph names.
+        entry = self._getGlifEntry(path)
+        if entry is None:
+            return None
+        if entry[2] is None:
+            glyphsDirectory = os.path.join(path, "glyphs")
+            contents = readPlist(os.path.join(glyphsDirectory, "contents.plist"))
+            unicodes = {}
+            for glyphName, fileName in contents.items():
+                glifPath = os.path.join(glyphsDirectory, fileName)
+                if not os.path.exists(glifPath):
+                    continue
+                f = open(glifPath, "rb")
+                try:
+                    text = f.read()
+                finally:
+                    f.close()
+                # the unicodes come before the outline
+                text = text.split("<outline", 1)[0]
+                unicodes[glyphName] = [int(value, 16) for value in _glifUnicode_RE.findall(text)]
+            entry[2] = unicodes
+        return entry[2]
+
+    def getComponentBases(self, path):
+        # read from the .glif files on demand like the unicodes
+        entry = self._getGlifEntry(path)
+        if entry is None:
+            return None
+        if entry[3] is None:
+            glyphsDirectory = os.path.join(path, "glyphs")
+            contents = readPlist(os.path.join(glyphsDirectory, "contents.plist"))
+            bases = {}
+            for glyphName, fileName in contents.items():
+                glifPath = os.path.join(glyphsDirectory, fileName)
+                if os.path.exists(glifPath):
+                    bases[glyphName] = _readComponentBases(glifPath)
+            entry[3] = bases
+        return entry[3]
+
+_glifUnicode_RE = re.compile("<unicode\s+hex=[\"']([0-9A-Fa-f]+)[\"']")
+
+glyphNameIndex = GlyphNameIndex()
+
+
+class SortedGlyphList(object):
+
+    """
+    A list of unique glyph names that is always sorted.
+    Lookups use a binary search and groups of names are
+    added or removed in one operation.
+    """
+
+    def __init__(self, glyphNames=()):
+        self._glyphNames = list(set(glyphNames))
+        self._glyphNames.sort()
+
+    def __len__(self):
+        return len(self._glyphNames)
+
+    def __iter__(self):
+        return iter(self._glyphNames)
+
+    def __getitem__(self, index):
+        return self._glyphNames[index]
+
+    def _find(self, glyphName):
+        index = bisect_left(self._glyphNames, glyphName)
+        if index < len(self._glyphNames) and self._glyphNames[index] == glyphName:
+            return index
+        return None
+
+    def __contains__(self, glyphName):
+        return self._find(glyphName) is not None
+
+    def add(self, glyphName):
+        index = bisect_left(self._glyphNames, glyphName)
+        if index == len(self._glyphNames) or self._glyphNames[index] != glyphName:
+            self._glyphNames.insert(index, glyphName)
+
+    def remove(self, glyphName):
+        index = self._find(glyphName)
+        if index is not None:
+            del self._glyphNames[index]
+
+    def update(self, glyphNames):
+        glyphNames = [glyphName for glyphName in set(glyphNames) if glyphName not in self]
+        if len(glyphNames) < 32:
+            for glyphName in glyphNames:
+                self.add(glyphName)
+        else:
+            self._glyphNames.extend(glyphNames)
+            self._glyphNames.sort()
+
+    def differenceUpdate(self, glyphNames):
+        glyphNames = set(glyphNames)
+        if len(glyphNames) < 32:
+            for glyphName in glyphNames:
+                self.remove(glyphName)
+        else:
+            self._glyphNames = [glyphName for glyphName in self._glyphNames if glyphName not in glyphNames]
+
+    def clear(self):
+        self._glyphNames = []
+
+    def asList(self):
+        return list(self._glyphNames)
+
+
+_unicodeRange_RE = re.compile(
+        "^U\\+([0-9A-Fa-f]{1,6})" # first value
+        "(?:\\s*-\\s*(?:U\\+)?([0-9A-Fa-f]{1,6}))?$", # optional last value
+        re.IGNORECASE
+        )
+
+class GlyphSelectionModel(object):
+
+    """
+    The selected and unselected glyphs in the glyphs dialog.
+    A filter can be set to limit the glyphs that are visible
+    in the lists. The filter is either a glyph name pattern
+    or a Unicode range such as "U+0041-U+005A". Patterns
+    without wildcards match any part of a glyph name.
+    getUnicodes is called when a Unicode range filter is
+    first used and it must return a dict of glyph names
+    and unicode lists. getComponentBases is called when
+    the component bases are first needed and it must
+    return a dict of glyph names and base glyph lists.
+    """
+
+    def __init__(self, allGlyphs, selectedGlyphs=None, getUnicodes=None, getComponentBases=None):
+        self.allGlyphs = set(allGlyphs)
+        if selectedGlyphs is None:
+            selectedGlyphs = self.allGlyphs
+        self.selected = SortedGlyphList(selectedGlyphs)
+        self.unselected = SortedGlyphList(self.allGlyphs - set(selectedGlyphs))
+        self._getUnicodes = getUnicodes
+        self._unicodes = None
+        self._getComponentBases = getComponentBases
+        self._componentIndex = None
+        self._filter = None
+
+    def select(self, glyphNames):
+        self.unselected.differenceUpdate(glyphNames)
+        self.selected.update(glyphNames)
+
+    def deselect(self, glyphNames):
+        self.selected.differenceUpdate(glyphNames)
+        self.unselected.update(glyphNames)
+
+    def selectAll(self):
+        self.selected = SortedGlyphList(self.allGlyphs)
+        self.unselected.clear()
+
+    def deselectAll(self):
+        self.unselected = SortedGlyphList(self.allGlyphs)
+        self.selected.clear()
+
+    def setSelection(self, glyphNames):
+        glyphNames = self.allGlyphs & set(glyphNames)
+        self.selected = SortedGlyphList(glyphNames)
+        self.unselected = SortedGlyphList(self.allGlyphs - glyphNames)
+
+    def getComponentIndex(self):
+        if self._componentIndex is None:
+            bases = {}
+            if self._getComponentBases is not None:
+                bases = self._getComponentBases()
+            self._componentIndex = ComponentIndex(bases)
+        return self._componentIndex
+
+    def selectComponentBases(self):
+        """select the glyphs that the selected glyphs use as components"""
+        glyphNames = self.getComponentIndex().addComponentBases(self.selected)
+        self.select(self.allGlyphs.intersection(glyphNames))
+
+    def selectAffectedComposites(self):
+        """select the glyphs that use the selected glyphs as components"""
+        glyphNames = self.getComponentIndex().getAffectedComposites(self.selected)
+        self.select(self.allGlyphs.intersection(glyphNames))
+
+    def setFilter(self, text):
+        text = text.strip()
+        if not text:
+            self._filter = None
+            return
+        m = _unicodeRange_RE.match(text)
+        if m is not None:
+            first = int(m.group(1), 16)
+            last = first
+            if m.group(2):
+                last = int(m.group(2), 16)
+            if self._unicodes is None:
+                self._unicodes = {}
+                if self._getUnicodes is not None:
+                    self._unicodes = self._getUnicodes()
+            unicodes = self._unicodes
+            def glyphFilter(glyphName):
+                for value in unicodes.get(glyphName, []):
+                    if first <= value <= last:
+                        return True
+                return False
+        else:
+            if "*" not in text and "?" not in text and "[" not in text:
+                text = "*%s*" % text
+            def glyphFilter(glyphName):
+                return fnmatchcase(glyphName, text)
+        self._filter = glyphFilter
+
+    def _filterList(self, glyphList):
+        if self._filter is None:
+            return glyphList.asList()
+        return [glyphName for glyphName in glyphList if self._filter(glyphName)]
+
+    def getVisibleSelected(self):
+        return self._filterList(self.selected)
+
+    def getVisibleUnselected(self):
+        return self._filterList(self.unselected)
+
+
+def _collectUnicodes(fonts):
+    unicodes = {}
+    for path, font in fonts.items():
+        if font is None:
+            found = glyphNameIndex.getUnicodes(path)
+            if found is None:
+                continue
+            found = found.items()
+        else:
+            found = [(glyph.name, glyph.unicodes) for glyph in font]
+        for glyphName, values in found:
+            if glyphName not in unicodes:
+                unicodes[glyphName] = []
+            unicodes[glyphName].extend(values)
+    return unicodes
+
+
+def _collectComponentBases(fonts, backend):
+    bases = {}
+    for path, font in fonts.items():
+        if font is None:
+            found = glyphNameIndex.getComponentBases(path)
+            if found is None:
+                continue
+        else:
+            found = backend.getComponentBases(font)
+        for glyphName, baseGlyphNames in found.items():
+            if glyphName not in bases:
+                bases[glyphName] = []
+            bases[glyphName].extend(baseGlyphNames)
+    return bases
 
 
 class GlyphsDialog(object):
 
-    def __init__(self, fonts, glyphs, mode, callback):
-        self.allGlyphs = set()
+    def __init__(self, fonts, glyphs, mode, callback, backend=None):
+        if backend is None:
+            backend = FontLabBackend()
+        nameLists = []
         for path, font in fonts.items():
             if font is None:
-                contentsPath = os.path.join(path, "glyphs", "contents.plist")
-                if not os.path.exists(contentsPath):
+                glyphNames = glyphNameIndex.getGlyphNames(path)
+                if glyphNames is None:
                     continue
-                else:
-                    contents = readPlist(contentsPath)
-                    self.allGlyphs = self.allGlyphs | set(contents.keys())
             else:
-                self.allGlyphs = self.allGlyphs | set(font.keys())
-        if glyphs is None:
-            self.selectedGlyphs = list(self.allGlyphs)
-            self.selectedGlyphs.sort()
-            self.unselectedGlyphs = []
-        else:
-            self.selectedGlyphs = glyphs
-            self.unselectedGlyphs = list(self.allGlyphs - set(glyphs))
-            self.unselectedGlyphs.sort()
+                glyphNames = font.keys()
+            nameLists.append(glyphNames)
+        self.allGlyphs = set(chain(*nameLists))
+        self.model = GlyphSelectionModel(self.allGlyphs, glyphs, getUnicodes=lambda: _collectUnicodes(fonts),
+            getComponentBases=lambda: _collectComponentBases(fonts, backend))
+        self.visibleUnselectedGlyphs = self.model.getVisibleUnselected()
+        self.visibleSelectedGlyphs = self.model.getVisibleSelected()
 
         self.callback = callback
         mode = mode.title()
@@ -476,154 +935,302 @@ class GlyphsDialog(object):
         self.w = dialogKit.ModalDialog((472, 400), "Glyphs", okCallback=self.okCallback)
 
         self.w.unselectedTitle = dialogKit.TextBox((12, 12, 150, 20), "Ignore:")
-        self.w.unselectedGlyphsList = dialogKit.List((12, 37, 150, -60), self.unselectedGlyphs)
+        self.w.unselectedGlyphsList = dialogKit.List((12, 37, 150, -60), self.visibleUnselectedGlyphs)
 
         self.w.addSelectionButton = dialogKit.Button((172, 37, 130, 20), ">>>", callback=self.addSelectionCallback)
         self.w.removeSelectionButton = dialogKit.Button((172, 67, 130, 20), "<<<", callback=self.removeSelectionCallback)
         self.w.addAllButton = dialogKit.Button((172, 97, 130, 20), "%s All" % mode, callback=self.addAllCallback)
         self.w.removeAllButton = dialogKit.Button((172, 127, 130, 20), "Ignore All", callback=self.removeAllCallback)
         self.w.fromFontSelection = dialogKit.Button((172, 157, 130, 20), "Font Selection", callback=self.fontSelectionCallback)
+        self.w.addComponentsButton = dialogKit.Button((172, 187, 130, 20), "Add Components", callback=self.addComponentsCallback)
+        self.w.addCompositesButton = dialogKit.Button((172, 217, 130, 20), "Add Composites", callback=self.addCompositesCallback)
+        self.w.filterTitle = dialogKit.TextBox((172, 257, 130, 20), "Name or U+ Range:")
+        self.w.filterEditText = dialogKit.EditText((172, 282, 130, 22))
+        self.w.filterButton = dialogKit.Button((172, 312, 130, 20), "Filter", callback=self.filterCallback)
 
         self.w.selectedTitle = dialogKit.TextBox((310, 12, 150, 20), "%s:" % mode)
-        self.w.selectedGlyphsList = dialogKit.List((310, 37, 150, -60), self.selectedGlyphs)
+        self.w.selectedGlyphsList = dialogKit.List((310, 37, 150, -60), self.visibleSelectedGlyphs)
 
         self.w.open()
 
     def _updateLists(self):
-        self.w.unselectedGlyphsList.set(self.unselectedGlyphs)
-        self.w.selectedGlyphsList.set(self.selectedGlyphs)
+        self.visibleUnselectedGlyphs = self.model.getVisibleUnselected()
+        self.visibleSelectedGlyphs = self.model.getVisibleSelected()
+        self.w.unselectedGlyphsList.set(self.visibleUnselectedGlyphs)
+        self.w.selectedGlyphsList.set(self.visibleSelectedGlyphs)
 
     def addSelectionCallback(self, sender):
         s = self.w.unselectedGlyphsList.getSelection()
         if not s:
             return
-        s = self.unselectedGlyphs[s[0]]
-        self.selectedGlyphs.append(s)
-        self.selectedGlyphs.sort()
-        self.unselectedGlyphs.remove(s)
+        self.model.select([self.visibleUnselectedGlyphs[i] for i in s])
         self._updateLists()
 
     def removeSelectionCallback(self, sender):
         s = self.w.selectedGlyphsList.getSelection()
         if not s:
             return
-        s = self.selectedGlyphs[s[0]]
-        self.unselectedGlyphs.append(s)
-        self.unselectedGlyphs.sort()
-        self.selectedGlyphs.remove(s)
+        self.model.deselect([self.visibleSelectedGlyphs[i] for i in s])
         self._updateLists()
 
     def addAllCallback(self, sender):
-        self.selectedGlyphs = list(self.allGlyphs)
-        self.selectedGlyphs.sort()
-        self.unselectedGlyphs = []
+        self.model.selectAll()
         self._updateLists()
 
     def removeAllCallback(self, sender):
-        self.unselectedGlyphs = list(self.allGlyphs)
-        self.unselectedGlyphs.sort()
-        self.selectedGlyphs = []
+        self.model.deselectAll()
         self._updateLists()
 
     def fontSelectionCallback(self, sender):
         font = CurrentFont()
         if font is None:
             return
-        self.selectedGlyphs = list(font.selection)
-        self.unselectedGlyphs = list(set(self.allGlyphs) - set(self.selectedGlyphs))
-        self.unselectedGlyphs.sort()
+        self.model.setSelection(font.selection)
+        self._updateLists()
+
+    def addComponentsCallback(self, sender):
+        self.model.selectComponentBases()
+        self._updateLists()
+
+    def addCompositesCallback(self, sender):
+        self.model.selectAffectedComposites()
+        self._updateLists()
+
+    def filterCallback(self, sender):
+        self.model.setFilter(self.w.filterEditText.get())
         self._updateLists()
 
     def okCallback(self, sender):
-        self.callback(list(self.selectedGlyphs), list(self.unselectedGlyphs))
+        self.callback(self.model.selected.asList(), self.model.unselected.asList())
 
 
 # -------
 # Support
 # -------
 
+_segmentTypes = [None, "move", "line", "curve", "qcurve", "offcurve"]
+_segmentTypeCodes = dict([(segmentType, code) for code, segmentType in enumerate(_segmentTypes)])
+_smoothFlag = 0x08
+
+class InstructionContour(object):
+
+    """
+    A compact store for the points in a contour. The coordinates
+    are kept in a flat list and the segment type and smooth state
+    of each point are packed into a single byte.
+    """
+
+    __slots__ = ["coordinates", "flags", "names"]
+
+    def __init__(self):
+        self.coordinates = []
+        self.flags = array("B")
+        self.names = None
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __getstate__(self):
+        return self.coordinates, self.flags, self.names
+
+    def __setstate__(self, state):
+        self.coordinates, self.flags, self.names = state
+
+    def addPoint(self, pt, segmentType=None, smooth=False, name=None):
+        x, y = pt
+        self.coordinates.append(x)
+        self.coordinates.append(y)
+        flag = _segmentTypeCodes[segmentType]
+        if smooth:
+            flag = flag | _smoothFlag
+        if name is not None:
+            if self.names is None:
+                self.names = {}
+            self.names[len(self.flags)] = name
+        self.flags.append(flag)
+
+    def drawPoints(self, pointPen):
+        coordinates = self.coordinates
+        names = self.names or {}
+        pointPen.beginPath()
+        for index, flag in enumerate(self.flags):
+            pt = (coordinates[index * 2], coordinates[index * 2 + 1])
+            segmentType = _segmentTypes[flag & ~_smoothFlag]
+            smooth = bool(flag & _smoothFlag)
+            pointPen.addPoint(pt, segmentType, smooth, names.get(index))
+        pointPen.endPath()
+
+    def getInstructions(self):
+        coordinates = self.coordinates
+        names = self.names or {}
+        instructions = [dict(method="beginPath")]
+        for index, flag in enumerate(self.flags):
+            d = {
+                "method":"addPoint",
+                "pt":(coordinates[index * 2], coordinates[index * 2 + 1]),
+                "smooth":bool(flag & _smoothFlag)
+                }
+            segmentType = _segmentTypes[flag & ~_smoothFlag]
+            if segmentType is not None:
+                d["segmentType"] = segmentType
+            if index in names:
+                d["name"] = names[index]
+            instructions.append(d)
+        instructions.append(dict(method="endPath"))
+        return instructions
+
+
 class InstructionPointPen(AbstractPointPen):
 
     def __init__(self):
-        self._instructions = []
+        self._contours = []
+        self._currentContour = None
 
     def beginPath(self):
-        d = {
-            "method":"beginPath"
-            }
-        self._instructions.append(d)
+        self._currentContour = InstructionContour()
+        self._contours.append(self._currentContour)
 
     def endPath(self):
-        d = {
-            "method":"endPath"
-            }
-        self._instructions.append(d)
+        self._currentContour = None
 
     def addPoint(self, pt, segmentType=None, smooth=False, name=None, **kwargs):
-        d = {
-            "method":"addPoint",
-            "pt":pt,
-            }
-        if segmentType is not None:
-            d["segmentType"] = segmentType
-        if smooth is not None:
-            d["smooth"] = smooth
-        if name is not None:
-            d["name"] = name
-        self._instructions.append(d)
+        self._currentContour.addPoint(pt, segmentType, smooth, name)
 
     def addComponent(self, baseGlyphName, transformation):
-        d = {
-            "method":"addComponent",
-            "baseGlyphName":baseGlyphName,
-            "transformation":transformation
-            }
+        # components are not recorded
+        pass
 
-    def getInstructions(self):
+    def getContours(self):
         # filter out any single point contours (anchors)
+        return [contour for contour in self._contours if len(contour) > 1]
+
+    def getInstructions(self):
         instructions = []
-        pointStack = []
-        for instruction in self._instructions:
-            pointStack.append(instruction)
-            if instruction["method"] == "endPath":
-                if pointStack:
-                    if len(pointStack) > 3:
-                        instructions.extend(pointStack)
-                    pointStack = []
+        for contour in self.getContours():
+            instructions.extend(contour.getInstructions())
         return instructions
 
 
-def _drawPointStack(stack, pointPen):
-    for instruction in stack:
+def _iterInstructionContours(instructions, pointPen):
+    # instructions may be a list of contours or a list of
+    # instruction dicts created by an older version of
+    # InstructionPointPen. components are drawn immediately.
+    contour = None
+    for instruction in instructions:
+        if isinstance(instruction, InstructionContour):
+            yield instruction
+            continue
         meth = instruction["method"]
         if meth == "beginPath":
-            pointPen.beginPath()
+            contour = InstructionContour()
         elif meth == "endPath":
-            pointPen.endPath()
+            if contour is not None:
+                yield contour
+            contour = None
         elif meth == "addPoint":
-            pt = instruction["pt"]
-            smooth = instruction.get("smooth")
-            segmentType = instruction.get("segmentType")
-            name = instruction.get("name")
-            pointPen.addPoint(pt, segmentType, smooth, name)
+            contour.addPoint(instruction["pt"], instruction.get("segmentType"), instruction.get("smooth"), instruction.get("name"))
         elif meth == "addComponent":
-            baseGlyphName = instruction["baseGlyphName"]
-            transformation = instruction["transformation"]
-            pointPen.addComponent(baseGlyphName, transformation)
+            pointPen.addComponent(instruction["baseGlyphName"], instruction["transformation"])
         else:
             raise NotImplementedError, meth
 
 def instructionsDrawPoints(instructions, pointPen):
     """draw instructions created by InstructionPointPen"""
-    # filter out single point contours (anchors)
-    pointStack = []
-    for instruction in instructions:
-        pointStack.append(instruction)
-        meth = instruction["method"]
-        if meth == "endPath":
-            if len(pointStack) > 3:
-                _drawPointStack(pointStack, pointPen)
-            pointStack = []
+    if isinstance(instructions, basestring):
+        instructions = unpackMaskData(instructions)
+    for contour in _iterInstructionContours(instructions, pointPen):
+        # filter out single point contours (anchors)
+        if len(contour) > 1:
+            contour.drawPoints(pointPen)
+
+# --------------------
+# Compact Mask Storage
+# --------------------
+
+# mask data can be stored in the glyph lib as a string
+# rather than as a list of instruction dicts. the string
+# starts with a version marker followed by the contours
+# separated by "|". the points in a contour are separated
+# by ";" and each point is "x,y,type" with an optional
+# ",name". the type is a single character that is upper
+# case if the point is smooth.
+
+MASK_DATA_VERSION = 1
+
+_segmentTypeCharacters = {
+    None : "o",
+    "move" : "m",
+    "line" : "l",
+    "curve" : "c",
+    "qcurve" : "q",
+    "offcurve" : "f"
+}
+_characterSegmentTypes = dict([(character, segmentType) for segmentType, character in _segmentTypeCharacters.items()])
+
+_maskDataEscapes = [("%", "%25"), (",", "%2C"), (";", "%3B"), ("|", "%7C")]
+
+def _escapeMaskDataName(name):
+    for character, escape in _maskDataEscapes:
+        name = name.replace(character, escape)
+    return name
+
+def _unescapeMaskDataName(name):
+    escapes = list(_maskDataEscapes)
+    escapes.reverse()
+    for character, escape in escapes:
+        name = name.replace(escape, character)
+    return name
+
+def _packNumber(value):
+    if isinstance(value, float):
+        if value == int(value):
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+def _unpackNumber(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def packMaskData(contours):
+    """pack a list of InstructionContours into a string"""
+    packedContours = ["v%d" % MASK_DATA_VERSION]
+    for contour in contours:
+        coordinates = contour.coordinates
+        names = contour.names or {}
+        points = []
+        for index, flag in enumerate(contour.flags):
+            character = _segmentTypeCharacters[_segmentTypes[flag & ~_smoothFlag]]
+            if flag & _smoothFlag:
+                character = character.upper()
+            point = "%s,%s,%s" % (_packNumber(coordinates[index * 2]), _packNumber(coordinates[index * 2 + 1]), character)
+            if index in names:
+                point += "," + _escapeMaskDataName(names[index])
+            points.append(point)
+        packedContours.append(";".join(points))
+    return "|".join(packedContours)
+
+def unpackMaskData(data):
+    """unpack a string created by packMaskData into a list of InstructionContours"""
+    packedContours = data.split("|")
+    version = packedContours.pop(0)
+    if version != "v%d" % MASK_DATA_VERSION:
+        raise ValueError("Unknown mask data version: %s" % version)
+    contours = []
+    for packedContour in packedContours:
+        contour = InstructionContour()
+        for point in packedContour.split(";"):
+            fields = point.split(",")
+            x, y, character = fields[:3]
+            name = None
+            if len(fields) > 3:
+                name = _unescapeMaskDataName(fields[3])
+            segmentType = _characterSegmentTypes[character.lower()]
+            contour.addPoint((_unpackNumber(x), _unpackNumber(y)), segmentType, character.isupper(), name)
+        contours.append(contour)
+    return contours
 
 MASK_LIB_KEY = "org.robofab.fontlab.maskData"
 MARK_LIB_KEY = "org.robofab.fontlab.mark"
@@ -633,12 +1240,372 @@ FEATURES_CLASSES_KEY = "org.robofab.opentype.classes"
 GLYPH_ORDER_LIB_KEY = "org.robofab.glyphOrder"
 WWS_FAMILY_KEY = "com.typesupply.ufocentral.openTypeNameWWSFamilyName"
 WWS_SUBFAMILY_KEY = "com.typesupply.ufocentral.openTypeNameWWSSubfamilyName"
+EXPORT_MANIFEST_FILE_NAME = "com.typesupply.ufocentral.exportManifest.plist"
+IMPORT_MANIFEST_LIB_KEY = "com.typesupply.ufocentral.importManifest"
+
+# ----------
+# Components
+# ----------
+
+def _componentClosure(glyphNames, getReferences):
+    # the glyphs followed by the glyphs that they reference
+    # directly or through other glyphs, in the order found
+    closure = []
+    found = set()
+    for glyphName in glyphNames:
+        if glyphName not in found:
+            found.add(glyphName)
+            closure.append(glyphName)
+    index = 0
+    while index < len(closure):
+        for glyphName in getReferences(closure[index]):
+            if glyphName not in found:
+                found.add(glyphName)
+                closure.append(glyphName)
+        index += 1
+    return closure
+
+
+class ComponentIndex(object):
+
+    """
+    The component references between the glyphs of a font.
+    bases is a dict of glyph names and the names of the
+    glyphs that they use as components. The composites
+    of each glyph are indexed the first time they are
+    needed.
+    """
+
+    def __init__(self, bases):
+        self.bases = bases
+        self._composites = None
+
+    def getBases(self, glyphName):
+        return self.bases.get(glyphName, [])
+
+    def getComposites(self, glyphName):
+        if self._composites is None:
+            self._composites = {}
+            for compositeName, baseGlyphNames in self.bases.items():
+                for baseGlyphName in baseGlyphNames:
+                    if baseGlyphName not in self._composites:
+                        self._composites[baseGlyphName] = []
+                    self._composites[baseGlyphName].append(compositeName)
+        return self._composites.get(glyphName, [])
+
+    def addComponentBases(self, glyphNames):
+        """get the glyphs followed by all of the glyphs they are built from"""
+        return _componentClosure(glyphNames, self.getBases)
+
+    def getAffectedComposites(self, glyphNames):
+        """get the composites that use the glyphs directly or through other composites"""
+        closure = _componentClosure(glyphNames, self.getComposites)
+        return closure[len(set(glyphNames)):]
+
+
+def _readComponentBases(glifPath):
+    f = open(glifPath, "rb")
+    try:
+        text = f.read()
+    finally:
+        f.close()
+    return _glifComponent_RE.findall(text)
+
+_glifComponent_RE = re.compile("<component\s(?:[^>]*\s)?base=[\"']([^\"']+)[\"']")
+
+def _addUFOComponentBases(ufoPath, glyphNames):
+    # only the .glif files of the glyphs
+    # that are found are read
+    glyphsDirectory = os.path.join(ufoPath, "glyphs")
+    contents = readPlist(os.path.join(glyphsDirectory, "contents.plist"))
+    def getBases(glyphName):
+        fileName = contents.get(glyphName)
+        if fileName is None:
+            return []
+        glifPath = os.path.join(glyphsDirectory, fileName)
+        if not os.path.exists(glifPath):
+            return []
+        return _readComponentBases(glifPath)
+    return _componentClosure(glyphNames, getBases)
+
+# -------
+# Kerning
+# -------
+
+class KerningIndex(object):
+
+    """
+    An index of the kerning pairs and groups that each
+    glyph takes part in. A glyph takes part in the pairs
+    that have it or one of its groups on either side.
+    """
+
+    def __init__(self, kerning, groups):
+        self.kerning = kerning
+        self.groups = groups
+        self._glyphGroups = {}
+        for groupName, glyphNames in groups.items():
+            for glyphName in glyphNames:
+                if glyphName not in self._glyphGroups:
+                    self._glyphGroups[glyphName] = []
+                self._glyphGroups[glyphName].append(groupName)
+        self._sidePairs = {}
+        for pair in kerning.keys():
+            for side in set(pair):
+                if side not in self._sidePairs:
+                    self._sidePairs[side] = []
+                self._sidePairs[side].append(pair)
+
+    def getGroups(self, glyphNames):
+        """get the names of the groups that contain any of the glyphs"""
+        groupNames = set()
+        for glyphName in glyphNames:
+            groupNames.update(self._glyphGroups.get(glyphName, []))
+        return groupNames
+
+    def getPairs(self, glyphNames, groupNames=()):
+        """get the kerning pairs that the glyphs and the given groups take part in"""
+        pairs = set()
+        for side in self.getGroups(glyphNames).union(glyphNames, groupNames):
+            pairs.update(self._sidePairs.get(side, []))
+        return pairs
+
+    def subset(self, glyphNames, groupNames=()):
+        """get the kerning and groups that the glyphs and the given groups take part in"""
+        kerning = {}
+        for pair in self.getPairs(glyphNames, groupNames):
+            kerning[pair] = self.kerning[pair]
+        groups = {}
+        for groupName in self.getGroups(glyphNames).union(groupNames):
+            groups[groupName] = list(self.groups[groupName])
+        return kerning, groups
+
+
+def _findUFOKerningGroups(ufoPath, glyphNames):
+    # the groups in the UFO that contain any of the glyphs
+    groups = UFOReader(ufoPath).readGroups()
+    return KerningIndex({}, groups).getGroups(glyphNames)
+
+def _mergeKerningSubset(ufoPath, glyphNames, kerning, groups):
+    # merge the kerning and groups of a glyph subset into
+    # the UFO's. the pairs and groups that the glyphs took
+    # part in are replaced, so the subset must include the
+    # groups that the glyphs were in, and the glyphs are
+    # taken out of groups that no longer exist. None is
+    # returned for the data that hasn't changed so that
+    # it isn't written again.
+    reader = UFOReader(ufoPath)
+    oldGroups = reader.readGroups()
+    glyphNames = set(glyphNames)
+    if kerning is not None:
+        oldKerning = reader.readKerning()
+        oldPairs = KerningIndex(oldKerning, oldGroups).getPairs(glyphNames)
+        oldSubset = {}
+        for pair in oldPairs:
+            oldSubset[pair] = oldKerning.pop(pair)
+        if oldSubset == kerning:
+            kerning = None
+        else:
+            oldKerning.update(kerning)
+            kerning = oldKerning
+    if groups is not None:
+        oldGroupNames = KerningIndex({}, oldGroups).getGroups(glyphNames)
+        oldSubset = {}
+        for groupName in oldGroupNames:
+            oldSubset[groupName] = oldGroups[groupName]
+        if oldSubset == groups:
+            groups = None
+        else:
+            for groupName in oldGroupNames:
+                if groupName not in groups:
+                    oldGroups[groupName] = [glyphName for glyphName in oldGroups[groupName] if glyphName not in glyphNames]
+            oldGroups.update(groups)
+            groups = oldGroups
+    return kerning, groups
+
+# ---------
+# Font Info
+# ---------
+
+class InfoLibField(object):
+
+    """
+    A font info attribute that FontLab can't store. The value
+    is kept in the font lib and it is moved to fontinfo.plist
+    when exporting and back to the lib when importing.
+    Subclasses can override exportValue and importValue
+    to convert the value.
+    """
+
+    def __init__(self, libKey, infoAttribute):
+        self.libKey = libKey
+        self.infoAttribute = infoAttribute
+
+    def exportValue(self, value):
+        return value
+
+    def importValue(self, value):
+        return value
+
+infoLibFields = [
+    InfoLibField(WWS_FAMILY_KEY, "openTypeNameWWSFamilyName"),
+    InfoLibField(WWS_SUBFAMILY_KEY, "openTypeNameWWSSubfamilyName"),
+]
+
+def registerInfoLibField(field):
+    """add an InfoLibField to the fields handled during import and export"""
+    infoLibFields.append(field)
+
+
+class InfoOverlay(object):
 
-def _normalizeLineEndings(s):
-    return s.replace("\r\n", "\n").replace("\r", "\n")
+    """
+    Wraps a font info object for UFOReader.readInfo and
+    UFOWriter.writeInfo. The attributes in values are
+    taken from and stored in the values dict rather
+    than the wrapped info object.
+    """
+
+    def __init__(self, info, values):
+        self.__dict__["_info"] = info
+        self.__dict__["_values"] = values
+
+    def __getattr__(self, attr):
+        if attr in self._values:
+            return self._values[attr]
+        return getattr(self._info, attr)
+
+    def __setattr__(self, attr, value):
+        if attr in self._values:
+            self._values[attr] = value
+        else:
+            setattr(self._info, attr, value)
+
+class InfoSnapshot(object):
+
+    """
+    A plain copy of the font info attributes that are written
+    to a UFO. If no info is given the attributes are set by
+    UFOReader.readInfo.
+    """
+
+    def __init__(self, info=None):
+        if info is not None:
+            for attr in fontInfoAttributesVersion2:
+                setattr(self, attr, getattr(info, attr))
+
+    def copyTo(self, info):
+        for attr, value in self.__dict__.items():
+            setattr(info, attr, value)
+
+
+class GlyphSnapshot(AbstractPointPen):
+
+    """
+    A plain copy of the data in a glyph that is written
+    to a .glif. The given lib values are layered on top
+    of the glyph lib so that data that only exists in the
+    UFO, such as the mark and the mask, can be written
+    without being stored in the glyph. The outline is
+    recorded in InstructionContours. If no glyph is given
+    the snapshot is filled by GlyphSet.readGlyph and the
+    attributes that are not in the .glif are None.
+    """
+
+    def __init__(self, glyph=None, lib=None):
+        self.name = None
+        self.width = None
+        self.unicodes = None
+        self.note = None
+        self.lib = None
+        self._outline = []
+        self._currentContour = None
+        if glyph is not None:
+            self.name = glyph.name
+            self.width = glyph.width
+            self.unicodes = list(glyph.unicodes)
+            self.note = getattr(glyph, "note", None)
+            self.lib = dict(glyph.lib)
+            if lib is not None:
+                self.lib.update(lib)
+            glyph.drawPoints(self)
+
+    def beginPath(self):
+        self._currentContour = InstructionContour()
+        self._outline.append(self._currentContour)
+
+    def endPath(self):
+        self._currentContour = None
+
+    def addPoint(self, pt, segmentType=None, smooth=False, name=None, **kwargs):
+        self._currentContour.addPoint(pt, segmentType, smooth, name)
+
+    def addComponent(self, baseGlyphName, transformation):
+        self._outline.append((baseGlyphName, tuple(transformation)))
+
+    def drawPoints(self, pointPen):
+        for item in self._outline:
+            if isinstance(item, InstructionContour):
+                item.drawPoints(pointPen)
+            else:
+                baseGlyphName, transformation = item
+                pointPen.addComponent(baseGlyphName, transformation)
+
+
+class ExportSnapshot(object):
+
+    """
+    Everything that an export writes to a UFO. This is made
+    from the font on the main thread and it can be written
+    on any thread since it doesn't refer to the font.
+    The parts that are not being exported are None.
+    """
+
+    def __init__(self, ufoPath, formatVersion):
+        self.ufoPath = ufoPath
+        self.formatVersion = formatVersion
+        self.timerKey = ufoPath
+        self.info = None
+        self.kerning = None
+        self.groups = None
+        self.features = None
+        self.lib = None
+        self.glyphs = []
+        self.allGlyphs = True
+        self.glyphNameToFileNameFunc = None
+        self.onlyChangedGlyphs = False
+        self.newFile = False
+        self.kerningGlyphs = None
+
+
+class ImportSnapshot(object):
+
+    """
+    Everything that an import reads from a UFO. This is made
+    by parseUFO, which doesn't need the font, so it can be
+    made ahead of the import on another thread or in another
+    process. The parts that are not being imported are None.
+    glyphNames lists the glyphs to import. glyphs holds the
+    parsed glyphs, which may only be the first of them.
+    """
+
+    def __init__(self, ufoPath):
+        self.ufoPath = ufoPath
+        self.formatVersion = None
+        self.info = None
+        self.kerning = None
+        self.groups = None
+        self.features = None
+        self.lib = None
+        self.glyphNames = []
+        self.glyphs = []
+        self.parseDuration = 0
+
+
+def _getStagingPath(path):
+    return path + ".partial"
 
 def _findAvailablePathName(path):
-    import time
     folder = os.path.dirname(path)
     fileName = os.path.basename(path)
     fileName, extension = os.path.splitext(fileName)
@@ -652,158 +1619,1725 @@ def _findAvailablePathName(path):
     assert not os.path.exists(newPath)
     return newPath
 
+# ------------
+# Fingerprints
+# ------------
+
+class FingerprintPointPen(AbstractPointPen):
+
+    """a point pen that feeds everything it is given into a hash"""
+
+    def __init__(self, hash):
+        self._hash = hash
+
+    def beginPath(self):
+        self._hash.update("beginPath;")
+
+    def endPath(self):
+        self._hash.update("endPath;")
+
+    def addPoint(self, pt, segmentType=None, smooth=False, name=None, **kwargs):
+        self._hash.update("addPoint%r;" % ((pt, segmentType, bool(smooth), name),))
+
+    def addComponent(self, baseGlyphName, transformation):
+        self._hash.update("addComponent%r;" % ((baseGlyphName, tuple(transformation)),))
+
+
+def _fingerprintRepr(obj):
+    # a repr that doesn't depend on dict ordering
+    if isinstance(obj, dict):
+        items = [(_fingerprintRepr(key), _fingerprintRepr(value)) for key, value in obj.items()]
+        items.sort()
+        return "{%s}" % ", ".join(["%s: %s" % item for item in items])
+    elif isinstance(obj, (list, tuple)):
+        return "[%s]" % ", ".join([_fingerprintRepr(i) for i in obj])
+    return repr(obj)
+
+def glyphFingerprint(glyph):
+    """get a hash of everything in the glyph that is written to a .glif"""
+    hash = md5()
+    glyph.drawPoints(FingerprintPointPen(hash))
+    hash.update(_fingerprintRepr(glyph.width))
+    hash.update(_fingerprintRepr(glyph.unicodes))
+    hash.update(_fingerprintRepr(getattr(glyph, "note", None)))
+    hash.update(_fingerprintRepr(dict(glyph.lib)))
+    return hash.hexdigest()
+
+def _readExportManifest(ufoPath, formatVersion):
+    # the manifest is only usable if the UFO is
+    # still in the format that it was written in
+    manifestPath = os.path.join(ufoPath, EXPORT_MANIFEST_FILE_NAME)
+    if not os.path.exists(manifestPath):
+        return None
+    if not os.path.exists(os.path.join(ufoPath, "metainfo.plist")):
+        return None
+    if UFOReader(ufoPath).formatVersion != formatVersion:
+        return None
+    manifest = readPlist(manifestPath)
+    if manifest.get("formatVersion") != formatVersion:
+        return None
+    return manifest
+
+def _writeExportManifest(ufoPath, manifest):
+    writePlist(manifest, os.path.join(ufoPath, EXPORT_MANIFEST_FILE_NAME))
+
+def _glyphNeedsWriting(glyphsDirectory, recorded, glyphName, fingerprint):
+    # a glyph needs to be written if its fingerprint
+    # is different from the one recorded during the
+    # last export or if its .glif has been modified
+    # or removed since then.
+    if glyphName not in recorded:
+        return True
+    oldFingerprint, fileName, modificationTime = recorded[glyphName]
+    if fingerprint != oldFingerprint:
+        return True
+    glifPath = os.path.join(glyphsDirectory, fileName)
+    if not os.path.exists(glifPath) or os.path.getmtime(glifPath) != modificationTime:
+        return True
+    return False
+
+# -----------
+# Mask Layers
+# -----------
+
+class MaskLayerBatch(object):
+
+    """
+    Read or write the mask layers of many glyphs in one
+    pass. Only the glyphs that actually have mask data
+    are read. The time spent on each glyph is recorded
+    in the timings dictionary.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.timings = {}
+
+    def extractGlyph(self, glyph):
+        # return the mask contours of a glyph
+        # or None if the glyph has no mask
+        if not self.backend.hasMask(glyph):
+            return None
+        start = time.time()
+        pen = InstructionPointPen()
+        self.backend.readMask(glyph, pen)
+        contours = pen.getContours()
+        self.timings[glyph.name] = time.time() - start
+        return contours
+
+    def restore(self, font, masks):
+        progress = self.backend.progress
+        glyphNames = masks.keys()
+        glyphNames.sort()
+        for glyphName in glyphNames:
+            start = time.time()
+            self.backend.writeMask(font[glyphName], masks[glyphName])
+            self.timings[glyphName] = time.time() - start
+            progress.tickGlyph()
+        # close all glyph windows. sometimes this actually works.
+        self.backend.closeGlyphWindows()
+
+# ---------------
+# Instrumentation
+# ---------------
+
+class NullPhaseTimer(object):
+
+    """a phase timer that records nothing"""
+
+    enabled = False
+
+    def start(self):
+        return None
+
+    def stop(self, key, phase, start, glyphCount=0, exclude=0):
+        pass
+
+    def add(self, key, phase, duration, calls=1, glyphCount=0):
+        pass
+
+    def beginBatch(self):
+        pass
+
+    def endBatch(self):
+        pass
+
+
+class PhaseTimer(NullPhaseTimer):
+
+    """
+    Record the wall time, the number of calls and the
+    number of glyphs of each phase of the exports and
+    imports. The phases are recorded separately for
+    each file. If profile is True the batch is also run
+    under cProfile and the statistics can be retrieved
+    with getProfileStats. Phases may be recorded from
+    any thread.
+    """
+
+    enabled = True
+
+    def __init__(self, profile=False):
+        # key -> phase -> [duration, calls, glyphs]
+        self.phases = {}
+        self._keyOrder = []
+        self._phaseOrder = {}
+        self._lock = None
+        if threading is not None:
+            self._lock = threading.Lock()
+        self._batchStart = None
+        self.batchDuration = 0
+        self._profiler = None
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        return time.time()
+
+    def stop(self, key, phase, start, glyphCount=0, exclude=0):
+        # exclude is the time spent on phases recorded within this one
+        self.add(key, phase, time.time() - start - exclude, glyphCount=glyphCount)
+
+    def add(self, key, phase, duration, calls=1, glyphCount=0):
+        # the export pipeline records its phases
+        # while the next font is being copied
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            if key not in self.phases:
+                self.phases[key] = {}
+                self._keyOrder.append(key)
+                self._phaseOrder[key] = []
+            phases = self.phases[key]
+            if phase not in phases:
+                phases[phase] = [0, 0, 0]
+                self._phaseOrder[key].append(phase)
+            record = phases[phase]
+            record[0] += duration
+            record[1] += calls
+            record[2] += glyphCount
+        finally:
+            if self._lock is not None:
+                self._lock.release()
+
+    def beginBatch(self):
+        self._batchStart = time.time()
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    def endBatch(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._batchStart is not None:
+            self.batchDuration += time.time() - self._batchStart
+            self._batchStart = None
+
+    def getRecords(self):
+        """get (key, phase, duration, calls, glyph count) tuples in the order they were first recorded"""
+        records = []
+        for key in self._keyOrder:
+            for phase in self._phaseOrder[key]:
+                duration, calls, glyphCount = self.phases[key][phase]
+                records.append((key, phase, duration, calls, glyphCount))
+        return records
+
+    def getProfileStats(self):
+        """get a pstats.Stats object for the profiled batches"""
+        if self._profiler is None:
+            return None
+        import pstats
+        return pstats.Stats(self._profiler)
+
+    def report(self):
+        """get the recorded timings as text"""
+        lines = ["UFO Central Timings", "-------------------"]
+        for key in self._keyOrder:
+            lines.append("")
+            lines.append(os.path.basename(key))
+            total = 0
+            for phase in self._phaseOrder[key]:
+                duration, calls, glyphCount = self.phases[key][phase]
+                total += duration
+                line = "    %-12s %9.3fs %6d call" % (phase, duration, calls)
+                if calls != 1:
+                    line += "s"
+                if glyphCount:
+                    line += " %8d glyph" % glyphCount
+                    if glyphCount != 1:
+                        line += "s"
+                lines.append(line)
+            lines.append("    %-12s %9.3fs" % ("total", total))
+        lines.append("")
+        lines.append("Batch: %.3fs" % self.batchDuration)
+        return "\n".join(lines)
+
+# --------
+# Progress
+# --------
+
+class BatchCancelled(Exception):
+
+    """raised when a batch has been cancelled"""
+
+
+class NullBatchProgress(object):
+
+    """a batch progress that reports nothing and is never cancelled"""
+
+    cancelled = False
+
+    def beginBatch(self, jobCount, backend=None):
+        pass
+
+    def endBatch(self, failed=False):
+        pass
+
+    def beginJob(self, path):
+        pass
+
+    def endJob(self):
+        pass
+
+    def addGlyphs(self, count):
+        pass
+
+    def tickGlyph(self):
+        pass
+
+    def cancel(self):
+        pass
+
+    def checkCancelled(self):
+        pass
+
+
+def _formatDuration(seconds):
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class BatchProgress(NullBatchProgress):
+
+    """
+    Report the files and glyphs that have been processed,
+    the throughput and an estimate of the time remaining.
+    The progress is shown by the backend and written to
+    logPath if it is given. The batch can be cancelled
+    by calling cancel, with the backend's progress bar or
+    by creating a file at cancelPath. Cancelling is
+    cooperative: BatchCancelled is raised at the next
+    point where the batch can stop without leaving a
+    font or a file half done.
+    """
+
+    def __init__(self, logPath=None, cancelPath=None, interval=0.25, logInterval=5):
+        self.logPath = logPath
+        self.cancelPath = cancelPath
+        self.interval = interval
+        self.logInterval = logInterval
+        self.cancelled = False
+        self.jobCount = 0
+        self.jobsDone = 0
+        self.glyphsDone = 0
+        self.jobGlyphCount = 0
+        self.jobGlyphsDone = 0
+        self._path = None
+        self._backend = None
+        self._log = None
+        self._batchStart = None
+        self._lastUpdate = 0
+        self._lastLog = 0
+
+    def beginBatch(self, jobCount, backend=None):
+        self.jobCount = jobCount
+        self.jobsDone = 0
+        self.glyphsDone = 0
+        self.cancelled = False
+        self._backend = backend
+        self._batchStart = time.time()
+        # a cancel file left by an earlier batch
+        if self.cancelPath is not None and os.path.exists(self.cancelPath):
+            os.remove(self.cancelPath)
+        if self.logPath is not None:
+            self._log = open(self.logPath, "a")
+        if backend is not None:
+            backend.beginProgress("UFO Central")
+        self._write("Batch started: %d file%s" % (jobCount, jobCount != 1 and "s" or ""))
+
+    def endBatch(self, failed=False):
+        if self.cancelled:
+            self._write("Batch cancelled: %s" % self.getStatus())
+        elif failed:
+            self._write("Batch failed: %s" % self.getStatus())
+        else:
+            self._write("Batch finished: %s" % self.getStatus())
+        if self._backend is not None:
+            self._backend.endProgress()
+            self._backend = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def beginJob(self, path):
+        self._path = path
+        self.jobGlyphCount = 0
+        self.jobGlyphsDone = 0
+        self._write("Started %s" % path)
+        self._update()
+
+    def endJob(self):
+        self.jobsDone += 1
+        self.jobGlyphCount = 0
+        self.jobGlyphsDone = 0
+        self._write("Finished %s" % self._path)
+        self._update()
+
+    def addGlyphs(self, count):
+        """add to the number of glyphs expected in the current file"""
+        self.jobGlyphCount += count
+
+    def tickGlyph(self):
+        self.glyphsDone += 1
+        self.jobGlyphsDone += 1
+        now = time.time()
+        if now - self._lastUpdate >= self.interval:
+            self._update(now)
+
+    def cancel(self):
+        """cancel the batch. this may be called from any thread."""
+        self.cancelled = True
+
+    def checkCancelled(self):
+        if self.cancelled:
+            raise BatchCancelled("The batch was cancelled.")
+
+    def getFraction(self):
+        if not self.jobCount:
+            return 0.0
+        done = float(self.jobsDone)
+        if self.jobGlyphCount:
+            done += min(1.0, float(self.jobGlyphsDone) / self.jobGlyphCount)
+        return min(1.0, done / self.jobCount)
+
+    def getStatus(self):
+        elapsed = time.time() - self._batchStart
+        fraction = self.getFraction()
+        status = "%d of %d files, %d glyphs" % (self.jobsDone, self.jobCount, self.glyphsDone)
+        if elapsed > 0:
+            status += ", %.0f glyphs/s" % (self.glyphsDone / elapsed)
+        if 0 < fraction < 1:
+            status += ", %s remaining" % _formatDuration(elapsed * (1 - fraction) / fraction)
+        return status
+
+    def _update(self, now=None):
+        if now is None:
+            now = time.time()
+        self._lastUpdate = now
+        if self.cancelPath is not None and os.path.exists(self.cancelPath):
+            self.cancel()
+        if self._backend is not None:
+            if not self._backend.updateProgress(self.getFraction(), self.getStatus()):
+                self.cancel()
+        if now - self._lastLog >= self.logInterval:
+            self._write(self.getStatus())
+
+    def _write(self, text):
+        self._lastLog = time.time()
+        text = "%s %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), text)
+        if self._log is not None:
+            self._log.write(text + "\n")
+            self._log.flush()
+        if self._backend is not None:
+            self._backend.logProgress(text)
+
+# --------
+# Backends
+# --------
+
+class FontBackend(object):
+
+    """
+    The environment that exportUFO and importUFO work in.
+    Subclasses provide the fonts and the glyph window
+    operations. This allows the import and export code
+    to be run with stand-in fonts outside of FontLab.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.maskTimings = {}
+        self.timer = NullPhaseTimer()
+        self.progress = NullBatchProgress()
+        self._fontIndex = None
+
+    def allFonts(self):
+        raise NotImplementedError
+
+    def currentFont(self):
+        raise NotImplementedError
+
+    def openFont(self, path):
+        raise NotImplementedError
+
+    def newFont(self):
+        raise NotImplementedError
+
+    def message(self, text):
+        self.messages.append(text)
+
+    # the open fonts are indexed by path the first time
+    # a font is looked up. the index is kept up to date
+    # when fonts are opened, saved and closed through the
+    # backend. fonts without a path are not indexed.
+
+    def _getFontIndex(self):
+        if self._fontIndex is None:
+            self._fontIndex = {}
+            for font in self.allFonts():
+                if font.path is not None:
+                    self._fontIndex[os.path.normpath(font.path)] = font
+        return self._fontIndex
+
+    def invalidateFontIndex(self):
+        self._fontIndex = None
+
+    def getOpenFontsByPath(self):
+        """get a dict of paths and open fonts"""
+        fonts = {}
+        for font in self._getFontIndex().values():
+            fonts[font.path] = font
+        return fonts
+
+    def findFont(self, path):
+        """get the open font with path or None"""
+        return self._getFontIndex().get(os.path.normpath(path))
+
+    def findOrOpenFont(self, path):
+        """
+        Get the open font with path. If the font is not open
+        it is opened. This returns the font, or None if the
+        file doesn't exist, and whether the font was opened.
+        """
+        font = self.findFont(path)
+        if font is not None:
+            return font, False
+        if not os.path.exists(path):
+            return None, False
+        font = self.openFont(path)
+        self._getFontIndex()[os.path.normpath(path)] = font
+        return font, True
+
+    def saveFont(self, font, path):
+        index = self._getFontIndex()
+        if font.path is not None and index.get(os.path.normpath(font.path)) is font:
+            del index[os.path.normpath(font.path)]
+        font.save(path)
+        index[os.path.normpath(path)] = font
+
+    def closeFont(self, font):
+        index = self._getFontIndex()
+        if font.path is not None and index.get(os.path.normpath(font.path)) is font:
+            del index[os.path.normpath(font.path)]
+        font.close()
+
+    def activateFont(self, font):
+        pass
+
+    def hasMask(self, glyph):
+        return False
+
+    def readMask(self, glyph, pointPen):
+        pass
+
+    def writeMask(self, glyph, instructions):
+        pass
+
+    def closeGlyphWindows(self):
+        pass
+
+    def getGlyphHints(self, glyph):
+        return None
+
+    def getGlyphOrder(self, font):
+        return font.keys()
+
+    def getComponentBases(self, font):
+        bases = {}
+        for glyph in font:
+            bases[glyph.name] = [component.baseGlyph for component in glyph.components]
+        return bases
+
+    def getGlyphNameToFileNameFunc(self, font):
+        return font.getGlyphNameToFileNameFunc()
+
+    def writeFeaturesToLib(self, font, fontLib):
+        # format version 1 stores the features in the lib
+        pass
+
+    def snapshotInfo(self, info):
+        return InfoSnapshot(info)
+
+    def getGlyphPointPen(self, glyph):
+        return glyph.getPointPen()
+
+    def setGlyphHints(self, glyph, hints):
+        pass
+
+    def readFeaturesFromLib(self, font, fontLib, setFeatures=True):
+        # format version 1 stores the features in the lib
+        pass
+
+    def beginProgress(self, title):
+        pass
+
+    def updateProgress(self, fraction, status):
+        # return False if the user has cancelled
+        return True
+
+    def endProgress(self):
+        pass
+
+    def logProgress(self, text):
+        pass
+
+
+class FontLabBackend(FontBackend):
+
+    def allFonts(self):
+        return AllFonts()
+
+    def currentFont(self):
+        return CurrentFont()
+
+    def openFont(self, path):
+        return OpenFont(path)
+
+    def newFont(self):
+        return NewFont()
+
+    def message(self, text):
+        super(FontLabBackend, self).message(text)
+        Message(text)
+
+    def activateFont(self, font):
+        fl.ifont = font.fontIndex
+
+    def hasMask(self, glyph):
+        # the mask layer can be inspected without
+        # opening a glyph window
+        mask = glyph.naked().mask
+        return mask is not None and len(mask) > 0
+
+    def readMask(self, glyph, pointPen):
+        RGlyphFL(glyph.naked().mask).drawPoints(pointPen)
+
+    def writeMask(self, glyph, instructions):
+        # open a glyph window
+        fl.EditGlyph(glyph.index)
+        # switch to the mask layer
+        fl.CallCommand(fl_cmd.ViewEditMask)
+        # add the mask data
+        pen = glyph.getPointPen()
+        instructionsDrawPoints(instructions, pen)
+        # switch back to the edit layer
+        fl.CallCommand(fl_cmd.ViewEditMask)
+
+    def closeGlyphWindows(self):
+        fl.CallCommand(fl_cmd.WindowCloseAllGlyphWindows)
+
+    def getGlyphHints(self, glyph):
+        return _glyphHintsToDict(glyph.naked())
+
+    def getGlyphOrder(self, font):
+        return [nakedGlyph.name for nakedGlyph in font.naked().glyphs]
+
+    def getComponentBases(self, font):
+        # FontLab components refer to their base by index
+        nakedGlyphs = font.naked().glyphs
+        glyphNames = [nakedGlyph.name for nakedGlyph in nakedGlyphs]
+        bases = {}
+        for nakedGlyph in nakedGlyphs:
+            bases[nakedGlyph.name] = [glyphNames[component.index] for component in nakedGlyph.components]
+        return bases
+
+    def getGlyphNameToFileNameFunc(self, font):
+        # fall back to short file names as writeUFO does
+        func = font.getGlyphNameToFileNameFunc()
+        if func is None:
+            func = glyphNameToShortFileName
+        return func
+
+    def writeFeaturesToLib(self, font, fontLib):
+        font._writeOpenTypeFeaturesToLib(fontLib)
+
+    def snapshotInfo(self, info):
+        # keep robofab from complaining about the
+        # attributes that FontLab doesn't support
+        objectsFL._IN_UFO_EXPORT = True
+        try:
+            return InfoSnapshot(info)
+        finally:
+            objectsFL._IN_UFO_EXPORT = False
+
+    def getGlyphPointPen(self, glyph):
+        return FLPointPen(glyph.naked())
+
+    def setGlyphHints(self, glyph, hints):
+        _dictHintsToGlyph(glyph.naked(), hints)
+
+    def readFeaturesFromLib(self, font, fontLib, setFeatures=True):
+        font._readOpenTypeFeaturesFromLib(fontLib, setFeatures=setFeatures)
+
+    def beginProgress(self, title):
+        fl.BeginProgress(title, 1000)
+
+    def updateProgress(self, fraction, status):
+        # TickProgress returns 0 when Cancel has been pressed
+        return fl.TickProgress(int(fraction * 1000)) != 0
+
+    def endProgress(self):
+        fl.EndProgress()
+
+    def logProgress(self, text):
+        print text
+
 # ---------------
 # Import & Export
 # ---------------
 
 def exportUFO(font, newFile=True, doInfo=True, doKerning=True, doGroups=True, doLib=True, doFeatures=True,
-    doHints=False, doMarks=True, doMasks=True, glyphs=None, formatVersion=2):
+    doHints=False, doMarks=True, doMasks=True, glyphs=None, formatVersion=2, onlyChangedGlyphs=False,
+    compactMasks=False, addComponentBases=False, subsetKerning=False, backend=None, pipeline=None, callback=None):
+    """
+    Export a font to a UFO. The data is copied out of the
+    font and then written. If an ExportPipeline is given
+    the writing is handed to it and this returns as soon
+    as the data has been copied. callback is called with
+    the path of the UFO once it has been written. If
+    addComponentBases is True the glyphs that the given
+    glyphs use as components are exported with them. If
+    subsetKerning is True only the kerning pairs and groups
+    that the given glyphs take part in are exported. They
+    are merged into the kerning and groups of an existing UFO.
+    """
+    if backend is None:
+        backend = FontLabBackend()
+    snapshot = snapshotFont(font, newFile=newFile, doInfo=doInfo, doKerning=doKerning, doGroups=doGroups,
+        doLib=doLib, doFeatures=doFeatures, doHints=doHints, doMarks=doMarks, doMasks=doMasks, glyphs=glyphs,
+        formatVersion=formatVersion, onlyChangedGlyphs=onlyChangedGlyphs, compactMasks=compactMasks,
+        addComponentBases=addComponentBases, subsetKerning=subsetKerning, backend=backend)
+    if snapshot is None:
+        return
+    if pipeline is None:
+        writeExportSnapshot(snapshot, timer=backend.timer)
+        if callback is not None:
+            callback(snapshot.ufoPath)
+    else:
+        pipeline.submit(snapshot, callback)
+
+def snapshotFont(font, newFile=True, doInfo=True, doKerning=True, doGroups=True, doLib=True, doFeatures=True,
+    doHints=False, doMarks=True, doMasks=True, glyphs=None, formatVersion=2, onlyChangedGlyphs=False,
+    compactMasks=False, addComponentBases=False, subsetKerning=False, backend=None):
+    """copy the data that exportUFO writes out of the font"""
+    if backend is None:
+        backend = FontLabBackend()
+    timer = backend.timer
+    progress = backend.progress
+    timerKey = font.path
     # get the UFO path
     ufoPath = os.path.splitext(font.path)[0] + ".ufo"
     if not newFile:
         if not os.path.exists(ufoPath):
-            Message("Could not find the UFO file \"%s\"." % os.path.basename(ufoPath))
-            return
+            backend.message("Could not find the UFO file \"%s\"." % os.path.basename(ufoPath))
+            return None
     else:
         if os.path.exists(ufoPath):
             ufoPath = _findAvailablePathName(ufoPath)
     # make sure no bogus glyph names are coming in
     if glyphs is not None:
+        if addComponentBases:
+            glyphs = ComponentIndex(backend.getComponentBases(font)).addComponentBases(glyphs)
         glyphs = [glyphName for glyphName in glyphs if font.has_key(glyphName)]
+    if glyphs is None:
+        glyphNames = font.keys()
+    else:
+        glyphNames = glyphs
     # make the font the top font in FL
-    fl.ifont = font.fontIndex
-    # add the masks and marks to the glyph.lib
-    if doMasks or doMarks:
-        if glyphs is None:
-            glyphNames = font.keys()
-        else:
-            glyphNames = glyphs
-        for glyphName in glyphNames:
-            glyph = font[glyphName]
-            if doMarks:
-                mark = glyph.mark
-                glyph.lib[MARK_LIB_KEY] = mark
-            if doMasks:
-                # open a glyph window
-                fl.EditGlyph(glyph.index)
-                # switch to the mask layer
-                fl.CallCommand(fl_cmd.ViewEditMask)
-                # if the mask is empty, skip this step
-                if not len(glyph):
-                    # switch back to the edit layer
-                    fl.CallCommand(fl_cmd.ViewEditMask)
-                    continue
-                # get the mask data
-                pen = InstructionPointPen()
-                glyph.drawPoints(pen)
-                # switch back to the edit layer
-                fl.CallCommand(fl_cmd.ViewEditMask)
-                # write the mask data to the glyph lib
-                instructions = pen.getInstructions()
-                if instructions:
-                    glyph.lib[MASK_LIB_KEY] = instructions
-        # close all glyph windows. sometimes this actually works.
-        fl.CallCommand(fl_cmd.WindowCloseAllGlyphWindows)
-    # remove WWS names from the lib
-    wwsStorage = {}
-    if "openTypeNameWWSFamilyName" in font.lib:
-        wwsStorage["openTypeNameWWSFamilyName"] = font.lib.pop(WWS_FAMILY_KEY)
-    if "openTypeNameWWSSubfamilyName" in font.lib:
-        wwsStorage["openTypeNameWWSSubfamilyName"] = font.lib.pop(WWS_SUBFAMILY_KEY)
-    # write the UFO
-    font.writeUFO(path=ufoPath, doHints=doHints, doInfo=doInfo,
-        doKerning=doKerning, doGroups=doGroups, doLib=doLib, doFeatures=doFeatures, glyphs=glyphs,
-        formatVersion=formatVersion)
-    # add the WWS names to the info
+    backend.activateFont(font)
+    # the lib must be written if format version is 1
+    if not doLib and formatVersion == 1:
+        backend.message("The lib must be written when exporting format version 1.")
+        return None
+    # the UFO is written in pieces so the format
+    # version must be checked before anything is written
+    if os.path.exists(os.path.join(ufoPath, "metainfo.plist")):
+        if UFOReader(ufoPath).formatVersion != formatVersion:
+            if False in [doInfo, doKerning, doGroups, doLib, doFeatures, glyphs is None]:
+                backend.message("When overwriting an existing UFO with a different format version all files must be written.")
+                return None
+    start = timer.start()
+    snapshot = ExportSnapshot(ufoPath, formatVersion)
+    snapshot.timerKey = timerKey
+    snapshot.allGlyphs = glyphs is None
+    snapshot.onlyChangedGlyphs = onlyChangedGlyphs and not newFile
+    snapshot.newFile = newFile
+    # nothing in the font is modified during export.
+    # the font lib is copied and the data that only
+    # exists in the UFO is added to the copies.
+    fontLib = dict(font.lib)
+    infoValues = {}
+    for field in infoLibFields:
+        infoValues[field.infoAttribute] = None
+        if field.libKey in fontLib:
+            infoValues[field.infoAttribute] = field.exportValue(fontLib.pop(field.libKey))
+    if IMPORT_MANIFEST_LIB_KEY in fontLib:
+        del fontLib[IMPORT_MANIFEST_LIB_KEY]
     if doInfo:
-        infoPath = os.path.join(ufoPath, "fontinfo.plist")
-        info = readPlist(infoPath)
-        newInfo = deepcopy(info)
-        newInfo.update(wwsStorage)
-        if info != newInfo:
-            writePlist(newInfo, infoPath)
-    # put the WWS names back in the lib
-    font.lib.update(wwsStorage)
-    # remove the masks and marks from the glyph.lib
-    if doMasks or doMarks:
-        if glyphs is None:
-            glyphNames = font.keys()
+        snapshot.info = backend.snapshotInfo(InfoOverlay(font.info, infoValues))
+    if subsetKerning and glyphs is not None and (doKerning or doGroups):
+        # the groups that the glyphs were in when the UFO was
+        # written are included so that their pairs are kept
+        groupNames = []
+        if not newFile:
+            groupNames = [groupName for groupName in _findUFOKerningGroups(ufoPath, glyphs) if groupName in font.groups]
+        kerning, groups = KerningIndex(font.kerning.asDict(), font.groups).subset(glyphs, groupNames)
+        if doKerning:
+            snapshot.kerning = kerning
+        if doGroups:
+            snapshot.groups = groups
+        if not newFile:
+            snapshot.kerningGlyphs = glyphs
+    else:
+        if doKerning:
+            snapshot.kerning = font.kerning.asDict()
+        if doGroups:
+            snapshot.groups = {}
+            for groupName, group in font.groups.items():
+                snapshot.groups[groupName] = list(group)
+    if doFeatures:
+        if formatVersion == 2:
+            snapshot.features = font.features.text
         else:
-            glyphNames = glyphs
-        for glyphName in glyphNames:
-            glyph = font[glyphName]
-            lib = glyph.lib
-            if lib.has_key(MASK_LIB_KEY):
-                del lib[MASK_LIB_KEY]
-            if lib.has_key(MARK_LIB_KEY):
-                del lib[MARK_LIB_KEY]
+            backend.writeFeaturesToLib(font, fontLib)
+    if doLib:
+        if formatVersion == 1:
+            fontLib[postScriptHintDataLibKey] = font.psHints.asDict()
+        fontLib["public.glyphOrder"] = backend.getGlyphOrder(font)
+        snapshot.lib = fontLib
+    # copy the glyphs. the mark, mask and hints are
+    # added to the lib of each copy. nothing has been
+    # written yet so the export can be cancelled here.
+    snapshot.glyphNameToFileNameFunc = backend.getGlyphNameToFileNameFunc(font)
+    maskBatch = MaskLayerBatch(backend)
+    progress.addGlyphs(len(glyphNames))
+    for glyphName in glyphNames:
+        progress.checkCancelled()
+        glyph = font[glyphName]
+        exportLib = {}
+        if doMarks:
+            exportLib[MARK_LIB_KEY] = glyph.mark
+        if doMasks:
+            contours = maskBatch.extractGlyph(glyph)
+            if contours:
+                if compactMasks:
+                    instructions = packMaskData(contours)
+                else:
+                    instructions = []
+                    for contour in contours:
+                        instructions.extend(contour.getInstructions())
+                exportLib[MASK_LIB_KEY] = instructions
+        if doHints:
+            hints = backend.getGlyphHints(glyph)
+            if hints:
+                exportLib[postScriptHintDataLibKey] = hints
+        snapshot.glyphs.append(GlyphSnapshot(glyph, exportLib))
+        progress.tickGlyph()
+    # the time spent reading the masks is recorded separately
+    maskDuration = sum(maskBatch.timings.values())
+    timer.stop(timerKey, "snapshot", start, glyphCount=len(glyphNames), exclude=maskDuration)
+    if doMasks:
+        backend.maskTimings[font.path] = maskBatch.timings
+        timer.add(timerKey, "masks", maskDuration, glyphCount=len(maskBatch.timings))
+    return snapshot
+
+def writeExportSnapshot(snapshot, timer=None):
+    """write an ExportSnapshot to its UFO"""
+    if timer is None:
+        timer = NullPhaseTimer()
+    ufoPath = snapshot.ufoPath
+    # new UFOs are written to a staging location and moved
+    # into place once they are complete so that an interrupted
+    # export doesn't leave a partial UFO behind. existing UFOs
+    # are written in place. the manifest is written last so an
+    # interrupted incremental export is repaired by the next one.
+    writePath = ufoPath
+    if snapshot.newFile:
+        writePath = _getStagingPath(ufoPath)
+        if os.path.exists(writePath):
+            shutil.rmtree(writePath)
+    try:
+        _writeExportSnapshotData(snapshot, writePath, timer)
+    except:
+        # remove the staging folder of an export
+        # that failed or was interrupted
+        if writePath != ufoPath:
+            shutil.rmtree(writePath, True)
+        raise
+    if writePath != ufoPath:
+        os.rename(writePath, ufoPath)
+
+def _writeExportSnapshotData(snapshot, writePath, timer):
+    timerKey = snapshot.timerKey
+    ufoPath = snapshot.ufoPath
+    formatVersion = snapshot.formatVersion
+    writer = UFOWriter(writePath, formatVersion=formatVersion)
+    # write the font info
+    if snapshot.info is not None:
+        start = timer.start()
+        writer.writeInfo(snapshot.info)
+        timer.stop(timerKey, "info", start)
+    # write the kerning and groups. a subset is
+    # merged with the data already in the UFO.
+    kerning = snapshot.kerning
+    groups = snapshot.groups
+    if snapshot.kerningGlyphs is not None:
+        start = timer.start()
+        kerning, groups = _mergeKerningSubset(writePath, snapshot.kerningGlyphs, kerning, groups)
+        timer.stop(timerKey, "merge", start)
+    if kerning is not None:
+        start = timer.start()
+        writer.writeKerning(kerning)
+        timer.stop(timerKey, "kerning", start)
+    if groups is not None:
+        start = timer.start()
+        writer.writeGroups(groups)
+        timer.stop(timerKey, "groups", start)
+    # write the features
+    if snapshot.features is not None:
+        start = timer.start()
+        writer.writeFeatures(snapshot.features)
+        timer.stop(timerKey, "features", start)
+    # write the lib
+    if snapshot.lib is not None:
+        start = timer.start()
+        writer.writeLib(snapshot.lib)
+        timer.stop(timerKey, "lib", start)
+    # the fingerprints from the last export into this UFO
+    manifest = None
+    if snapshot.onlyChangedGlyphs:
+        manifest = _readExportManifest(ufoPath, formatVersion)
+        if manifest is None:
+            manifest = dict(formatVersion=formatVersion, glyphs={})
+    # write the glyphs
+    start = timer.start()
+    glyphSet = writer.getGlyphSet(snapshot.glyphNameToFileNameFunc)
+    glyphsDirectory = os.path.join(writePath, "glyphs")
+    fingerprints = {}
+    writtenGlyphs = []
+    for glyph in snapshot.glyphs:
+        glyphName = glyph.name
+        if manifest is not None:
+            fingerprint = glyphFingerprint(glyph)
+            fingerprints[glyphName] = fingerprint
+            if not _glyphNeedsWriting(glyphsDirectory, manifest["glyphs"], glyphName, fingerprint):
+                continue
+        glyphSet.writeGlyph(glyphName, glyph, glyph.drawPoints)
+        writtenGlyphs.append(glyphName)
+    # remove the glyphs written during a previous
+    # export that are no longer in the font
+    removedGlyphs = []
+    if manifest is not None and snapshot.allGlyphs:
+        recorded = manifest["glyphs"]
+        removedGlyphs = [glyphName for glyphName in recorded.keys() if glyphName not in fingerprints]
+        for glyphName in removedGlyphs:
+            if glyphName in glyphSet.contents:
+                glyphSet.deleteGlyph(glyphName)
+            del recorded[glyphName]
+    if writtenGlyphs or removedGlyphs:
+        glyphSet.writeContents()
+    timer.stop(timerKey, "glyphs", start, glyphCount=len(writtenGlyphs))
+    # record the fingerprints of the written glyphs
+    if manifest is not None:
+        start = timer.start()
+        recorded = manifest["glyphs"]
+        for glyphName in writtenGlyphs:
+            fileName = glyphSet.contents[glyphName]
+            modificationTime = os.path.getmtime(os.path.join(glyphsDirectory, fileName))
+            recorded[glyphName] = [fingerprints[glyphName], fileName, modificationTime]
+        _writeExportManifest(ufoPath, manifest)
+        timer.stop(timerKey, "manifest", start)
+
+def _hashFile(path):
+    f = open(path, "rb")
+    try:
+        return md5(f.read()).hexdigest()
+    finally:
+        f.close()
+
+def _compareImportManifest(ufoPath, manifest, glyphs=None):
+    # compare the .glif files in the UFO to the ones recorded
+    # during the last import. the files are only hashed if
+    # their modification time or size has changed.
+    # this returns the changed glyphs, the deleted glyphs
+    # and the updated manifest entries.
+    glyphsDirectory = os.path.join(ufoPath, "glyphs")
+    contents = readPlist(os.path.join(glyphsDirectory, "contents.plist"))
+    recorded = manifest["glyphs"]
+    if glyphs is None:
+        glyphNames = contents.keys()
+    else:
+        glyphNames = [glyphName for glyphName in glyphs if glyphName in contents]
+    changed = []
+    entries = {}
+    for glyphName in glyphNames:
+        fileName = contents[glyphName]
+        glifPath = os.path.join(glyphsDirectory, fileName)
+        stat = os.stat(glifPath)
+        entry = recorded.get(glyphName)
+        if entry is not None:
+            hash, oldFileName, modificationTime, size = entry
+            if oldFileName == fileName and modificationTime == stat.st_mtime and size == stat.st_size:
+                entries[glyphName] = entry
+                continue
+        hash = _hashFile(glifPath)
+        entries[glyphName] = [hash, fileName, stat.st_mtime, stat.st_size]
+        if entry is None or entry[0] != hash:
+            changed.append(glyphName)
+    if glyphs is None:
+        deleted = [glyphName for glyphName in recorded.keys() if glyphName not in contents]
+    else:
+        deleted = [glyphName for glyphName in glyphs if glyphName in recorded and glyphName not in contents]
+    changed.sort()
+    return changed, deleted, entries
+
+def _getGlyphOrder(fontLib, glyphSet):
+    # the glyphs in the order stored in the lib followed
+    # by any others in alphabetical order. the order is
+    # removed from the lib.
+    glyphOrder = None
+    for key in ("public.glyphOrder", "org.robofab.glyphOrder"):
+        if key in fontLib:
+            glyphOrder = fontLib.pop(key)
+            break
+    allGlyphNames = glyphSet.keys()
+    allGlyphNames.sort()
+    if glyphOrder is None:
+        return allGlyphNames
+    glyphNames = []
+    done = set()
+    for glyphName in glyphOrder:
+        if glyphName in glyphSet.contents and glyphName not in done:
+            glyphNames.append(glyphName)
+            done.add(glyphName)
+    for glyphName in allGlyphNames:
+        if glyphName not in done:
+            glyphNames.append(glyphName)
+    return glyphNames
+
+def _readGlyphSnapshots(glyphSet, glyphNames):
+    glyphs = []
+    for glyphName in glyphNames:
+        glyph = GlyphSnapshot()
+        glyphSet.readGlyph(glyphName, glyph, glyph)
+        glyph.name = glyphName
+        glyphs.append(glyph)
+    return glyphs
+
+def parseUFO(ufoPath, doInfo=True, doKerning=True, doGroups=True, doFeatures=True, glyphs=None, maxGlyphs=None):
+    """
+    Read the parts of a UFO that importUFO needs into an
+    ImportSnapshot. The lib is always read. If maxGlyphs
+    is given only that many glyphs are read and importUFO
+    reads the rest as it goes. This doesn't use FontLab so
+    it can be run on any thread.
+    """
+    start = time.time()
+    reader = UFOReader(ufoPath)
+    glyphSet = reader.getGlyphSet()
+    snapshot = ImportSnapshot(ufoPath)
+    snapshot.formatVersion = reader.formatVersion
+    snapshot.lib = reader.readLib()
+    if doInfo:
+        snapshot.info = InfoSnapshot()
+        reader.readInfo(snapshot.info)
+    glyphNames = _getGlyphOrder(snapshot.lib, glyphSet)
+    if glyphs is not None:
+        glyphs = set(glyphs)
+        glyphNames = [glyphName for glyphName in glyphNames if glyphName in glyphs]
+    snapshot.glyphNames = glyphNames
+    if maxGlyphs is not None:
+        glyphNames = glyphNames[:maxGlyphs]
+    snapshot.glyphs = _readGlyphSnapshots(glyphSet, glyphNames)
+    if doFeatures and snapshot.formatVersion > 1:
+        snapshot.features = reader.readFeatures()
+    if doKerning:
+        snapshot.kerning = reader.readKerning()
+    if doGroups:
+        snapshot.groups = reader.readGroups()
+    snapshot.parseDuration = time.time() - start
+    return snapshot
+
+def _iterGlyphChunks(snapshot, chunkSize, timer, timerKey):
+    # yield the glyphs of an ImportSnapshot in lists of
+    # chunkSize. the glyphs that were parsed with the
+    # snapshot come first and the rest are read from the
+    # UFO one chunk at a time.
+    glyphNames = snapshot.glyphNames[len(snapshot.glyphs):]
+    if snapshot.glyphs:
+        chunk = snapshot.glyphs
+        snapshot.glyphs = []
+        yield chunk
+    if not glyphNames:
+        return
+    glyphSet = UFOReader(snapshot.ufoPath).getGlyphSet()
+    for index in range(0, len(glyphNames), chunkSize):
+        start = timer.start()
+        chunk = _readGlyphSnapshots(glyphSet, glyphNames[index:index + chunkSize])
+        timer.stop(timerKey, "parse", start, glyphCount=len(chunk))
+        yield chunk
 
 def importUFO(ufoPath, newFile=True, saveFile=True, closeFile=True, doInfo=True, doKerning=True, doGroups=True,
-    doLib=True, doFeatures=True, doHints=False, doMarks=True, doMasks=True, glyphs=None):
+    doLib=True, doFeatures=True, doHints=False, doMarks=True, doMasks=True, glyphs=None, onlyChangedGlyphs=False,
+    chunkSize=500, addComponentBases=False, backend=None, snapshot=None):
+    """
+    Import a UFO into a font. The glyphs are read and added
+    chunkSize at a time so that the memory used doesn't grow
+    with the size of the font. If an ImportSnapshot made by
+    parseUFO with the same options is given, the parts of
+    the UFO in it are not read again. If addComponentBases
+    is True the glyphs that the given glyphs use as
+    components are imported with them. This returns the
+    path of the VFB if it was saved.
+    """
+    if backend is None:
+        backend = FontLabBackend()
+    timer = backend.timer
+    progress = backend.progress
+    timerKey = ufoPath
+    if glyphs is not None and addComponentBases:
+        glyphs = _addUFOComponentBases(ufoPath, glyphs)
     # get the VFB path
     vfbPath = os.path.splitext(ufoPath)[0] + ".vfb"
     if not newFile:
-        font = None
-        for font in AllFonts():
-            if font.path == vfbPath:
-                break
+        font = backend.findOrOpenFont(vfbPath)[0]
         if font is None:
-            if not os.path.exists(vfbPath):
-                Message("Could not find the FontLab file \"%s\"." % os.path.basename(vfbPath))
-                return
-            font = OpenFont(vfbPath)
+            backend.message("Could not find the FontLab file \"%s\"." % os.path.basename(vfbPath))
+            return
     else:
         if saveFile:
             if os.path.exists(vfbPath):
                 vfbPath = _findAvailablePathName(vfbPath)
-        font = NewFont()
+        font = backend.newFont()
     # make the font the top font in FL
-    fl.ifont = font.fontIndex
+    backend.activateFont(font)
+    # pull the import manifest out of the lib so that
+    # it isn't lost when the lib is read
+    manifest = font.lib.pop(IMPORT_MANIFEST_LIB_KEY, None)
+    if manifest is not None and manifest.get("ufoPath") != ufoPath:
+        manifest = None
+    # compare the UFO to the last import into this font
+    readGlyphs = glyphs
+    manifestEntries = None
+    if onlyChangedGlyphs and not newFile:
+        start = timer.start()
+        if manifest is None:
+            manifest = dict(ufoPath=ufoPath, glyphs={})
+        readGlyphs, deletedGlyphs, manifestEntries = _compareImportManifest(ufoPath, manifest, glyphs)
+        # glyphs that have been removed from the font
+        # since the last import need to be read again
+        for glyphName in manifestEntries.keys():
+            if glyphName not in readGlyphs and not font.has_key(glyphName):
+                readGlyphs.append(glyphName)
+        for glyphName in deletedGlyphs:
+            if font.has_key(glyphName):
+                font.removeGlyph(glyphName)
+            del manifest["glyphs"][glyphName]
+        timer.stop(timerKey, "manifest", start)
+        # the snapshot was made without knowing which glyphs changed
+        snapshot = None
     # read the UFO
-    font.readUFO(ufoPath, doHints=doHints, doInfo=doInfo, doKerning=doKerning,
-        doGroups=doGroups, doLib=doLib, doFeatures=doFeatures, glyphs=glyphs)
-    # load the masks and marks
-    if doMasks or doMarks:
-        for glyph in font:
-            lib = glyph.lib
-            if doMarks:
-                if lib.has_key(MARK_LIB_KEY):
-                    glyph.mark = lib[MARK_LIB_KEY]
-                    del lib[MARK_LIB_KEY]
-            if doMasks:
-                if lib.has_key(MASK_LIB_KEY):
-                    # open a glyph window
-                    fl.EditGlyph(glyph.index)
-                    # switch to the mask layer
-                    fl.CallCommand(fl_cmd.ViewEditMask)
-                    # add the mask data
-                    instructions = lib[MASK_LIB_KEY]
-                    pen = glyph.getPointPen()
-                    instructionsDrawPoints(instructions, pen)
-                    # switch back to the edit layer
-                    fl.CallCommand(fl_cmd.ViewEditMask)
-                    # clear the mask data from the glyph lib
-                    del lib[MASK_LIB_KEY]
-        # close all glyph windows. sometimes this actually works.
-        fl.CallCommand(fl_cmd.WindowCloseAllGlyphWindows)
-    # load the WWS names
+    if snapshot is None:
+        snapshot = parseUFO(ufoPath, doInfo=doInfo, doKerning=doKerning, doGroups=doGroups,
+            doFeatures=doFeatures, glyphs=readGlyphs, maxGlyphs=chunkSize)
+    timer.add(timerKey, "parse", snapshot.parseDuration, glyphCount=len(snapshot.glyphs))
+    fontLib = snapshot.lib
+    # read the font info. the values that FontLab can't
+    # store are put into the lib.
+    infoValues = {}
     if doInfo:
-        info = readPlist(os.path.join(ufoPath, "fontInfo.plist"))
-        if "openTypeNameWWSFamilyName" in info:
-            font.lib[WWS_FAMILY_KEY] = info["openTypeNameWWSFamilyName"]
-        elif "openTypeNameWWSFamilyName" in font.lib:
-            del font.lib[WWS_FAMILY_KEY]
-        if "openTypeNameWWSSubfamilyName" in info:
-            font.lib[WWS_SUBFAMILY_KEY] = info["openTypeNameWWSSubfamilyName"]
-        elif "openTypeNameWWSSubfamilyName" in font.lib:
-            del font.lib[WWS_SUBFAMILY_KEY]
+        start = timer.start()
+        for field in infoLibFields:
+            infoValues[field.infoAttribute] = None
+        snapshot.info.copyTo(InfoOverlay(font.info, infoValues))
+        timer.stop(timerKey, "info", start)
+    # add the glyphs a chunk at a time. the marks are
+    # set along the way and the masks are added after
+    # each chunk. the font is being changed so a
+    # cancelled import is finished before the batch stops.
+    progress.addGlyphs(len(snapshot.glyphNames))
+    maskBatch = MaskLayerBatch(backend)
+    for chunk in _iterGlyphChunks(snapshot, chunkSize, timer, timerKey):
+        start = timer.start()
+        masks = {}
+        for glyphSnapshot in chunk:
+            glyphName = glyphSnapshot.name
+            glyph = font.newGlyph(glyphName, clear=True)
+            lib = glyphSnapshot.lib
+            if lib is not None:
+                if doMarks and MARK_LIB_KEY in lib:
+                    glyph.mark = lib.pop(MARK_LIB_KEY)
+                if doMasks and MASK_LIB_KEY in lib:
+                    masks[glyphName] = lib.pop(MASK_LIB_KEY)
+                if doHints:
+                    hints = lib.pop(postScriptHintDataLibKey, None)
+                    if hints:
+                        backend.setGlyphHints(glyph, hints)
+                glyph.lib = lib
+            if glyphSnapshot.width is not None:
+                glyph.width = glyphSnapshot.width
+            if glyphSnapshot.unicodes is not None:
+                glyph.unicodes = glyphSnapshot.unicodes
+            if glyphSnapshot.note is not None:
+                glyph.note = glyphSnapshot.note
+            glyphSnapshot.drawPoints(backend.getGlyphPointPen(glyph))
+            progress.tickGlyph()
+        timer.stop(timerKey, "glyphs", start, glyphCount=len(chunk))
+        # add the mask data to the glyphs in the chunk that have it
+        if masks:
+            start = timer.start()
+            progress.addGlyphs(len(masks))
+            maskBatch.restore(font, masks)
+            timer.stop(timerKey, "masks", start, glyphCount=len(masks))
+        chunk = masks = None
+    if maskBatch.timings:
+        backend.maskTimings[font.path] = maskBatch.timings
+    # add the font level data
+    start = timer.start()
+    if doFeatures:
+        if snapshot.formatVersion == 1:
+            backend.readFeaturesFromLib(font, fontLib)
+        else:
+            font.features.text = snapshot.features
+    else:
+        # remove the features stored in the lib
+        backend.readFeaturesFromLib(font, fontLib, setFeatures=False)
+    if doKerning:
+        font.kerning.clear()
+        font.kerning.update(snapshot.kerning)
+    if doGroups:
+        font.groups.clear()
+        font.groups.update(snapshot.groups)
+    # the font hints are stored in the lib in format version 1
+    if doHints and snapshot.formatVersion == 1:
+        font.psHints._loadFromLib(fontLib)
+    if postScriptHintDataLibKey in fontLib:
+        del fontLib[postScriptHintDataLibKey]
+    if doLib:
+        font.lib.clear()
+        font.lib.update(fontLib)
+    if doInfo:
+        for field in infoLibFields:
+            value = infoValues[field.infoAttribute]
+            if value is not None:
+                font.lib[field.libKey] = field.importValue(value)
+            elif field.libKey in font.lib:
+                del font.lib[field.libKey]
+    timer.stop(timerKey, "font", start)
+    # record the glyphs that were imported
+    if manifestEntries is not None:
+        manifest["glyphs"].update(manifestEntries)
+    if manifest is not None:
+        font.lib[IMPORT_MANIFEST_LIB_KEY] = manifest
     # update the font
+    start = timer.start()
     font.update()
+    timer.stop(timerKey, "update", start)
     # save and close
     if saveFile:
-        font.save(vfbPath)
+        start = timer.start()
+        backend.saveFont(font, vfbPath)
+        timer.stop(timerKey, "save", start)
         if closeFile:
-            font.close()
+            start = timer.start()
+            backend.closeFont(font)
+            timer.stop(timerKey, "close", start)
+        return vfbPath
+    return None
+
+# ---------------
+# Export Pipeline
+# ---------------
+
+class ExportPipeline(object):
+
+    """
+    Write export snapshots in worker threads so that the
+    next font can be copied while the previous one is being
+    written. At most maxPending snapshots wait to be written
+    which limits the number of fonts held in memory. An
+    error raised while writing is raised again by finish.
+    If threads are not available the snapshots are written
+    as they are submitted.
+    """
+
+    def __init__(self, timer=None, workers=1, maxPending=1):
+        if timer is None:
+            timer = NullPhaseTimer()
+        self.timer = timer
+        self._errors = []
+        self._threads = []
+        self._queue = None
+        if threading is None:
+            return
+        self._queue = Queue.Queue(maxPending)
+        for i in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            snapshot = self._queue.get()
+            if snapshot is None:
+                break
+            snapshot, callback = snapshot
+            try:
+                writeExportSnapshot(snapshot, timer=self.timer)
+                if callback is not None:
+                    callback(snapshot.ufoPath)
+            except:
+                self._errors.append(sys.exc_info())
+
+    def submit(self, snapshot, callback=None):
+        """write a snapshot. callback is called with the path of the UFO once it has been written."""
+        if self._queue is None:
+            writeExportSnapshot(snapshot, timer=self.timer)
+            if callback is not None:
+                callback(snapshot.ufoPath)
+        else:
+            self._queue.put((snapshot, callback))
+
+    def finish(self):
+        """wait for all snapshots to be written"""
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._errors:
+            errorType, error, traceback = self._errors[0]
+            self._errors = []
+            raise errorType, error, traceback
+
+# -------------
+# Import Parser
+# -------------
+
+class _ParseResult(object):
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._snapshot = None
+        self._error = None
+
+    def set(self, snapshot, error):
+        self._snapshot = snapshot
+        self._error = error
+        self._event.set()
+
+    def get(self):
+        self._event.wait()
+        if self._error is not None:
+            errorType, error, traceback = self._error
+            raise errorType, error, traceback
+        return self._snapshot
+
+
+class ImportParser(object):
+
+    """
+    Parse UFOs with parseUFO ahead of their import. The UFOs
+    are parsed in worker threads or, if processes is True
+    and the multiprocessing module is available, in worker
+    processes, which lets the parsing use more than one core.
+    Worker processes can't be used inside of FontLab. If
+    neither is available the UFOs are parsed when they are
+    requested.
+    """
+
+    def __init__(self, workers=2, processes=False):
+        self._pool = None
+        self._queue = None
+        self._threads = []
+        self._pending = {}
+        if processes and multiprocessing is not None:
+            self._pool = multiprocessing.Pool(workers)
+        elif threading is not None:
+            self._queue = Queue.Queue()
+            for i in range(workers):
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            result, ufoPath, options = item
+            try:
+                result.set(parseUFO(ufoPath, **options), None)
+            except:
+                result.set(None, sys.exc_info())
+
+    def submit(self, key, ufoPath, **options):
+        """start parsing a UFO. the options are passed to parseUFO."""
+        if self._pool is not None:
+            self._pending[key] = self._pool.apply_async(parseUFO, (ufoPath,), options)
+        elif self._queue is not None:
+            result = _ParseResult()
+            self._pending[key] = result
+            self._queue.put((result, ufoPath, options))
+        else:
+            self._pending[key] = (ufoPath, options)
+
+    def get(self, key):
+        """get the ImportSnapshot for a submitted UFO. this waits for the parsing to finish."""
+        result = self._pending.pop(key)
+        if isinstance(result, tuple):
+            ufoPath, options = result
+            return parseUFO(ufoPath, **options)
+        return result.get()
+
+    def finish(self):
+        self._pending = {}
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+# -------
+# Journal
+# -------
+
+DIALOG_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".UFOCentralJournal.plist")
+
+def _stampPath(path):
+    # the sizes and modification times of a file
+    # or of all of the files in a directory
+    if not os.path.isdir(path):
+        return [[os.path.getsize(path), os.path.getmtime(path)]]
+    stamp = []
+    for directory, directoryNames, fileNames in os.walk(path):
+        directoryNames.sort()
+        fileNames.sort()
+        for fileName in fileNames:
+            filePath = os.path.join(directory, fileName)
+            stamp.append([filePath[len(path):], os.path.getsize(filePath), os.path.getmtime(filePath)])
+    return stamp
+
+
+class BatchJournal(object):
+
+    """
+    A record of the jobs in a batch that have been completed.
+    The journal is written after each job so that a batch
+    that was interrupted can be resumed. A job counts as
+    complete if it was run with the same options and
+    neither its input nor its output have been touched
+    since it was run. Files are compared by their sizes
+    and modification times. Unless resume
+    is True, the record of the previous batch is discarded.
+    Jobs that can't be recorded are listed in errors and
+    don't stop the batch.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = {}
+        self.errors = []
+        self._lock = None
+        if threading is not None:
+            self._lock = threading.Lock()
+        if os.path.exists(path):
+            if resume:
+                self.entries = readPlist(path).get("jobs", {})
+            else:
+                os.remove(path)
+
+    def _getJobKey(self, job):
+        options = [(key, value) for key, value in job.items() if key != "font"]
+        return md5(_fingerprintRepr(dict(options))).hexdigest()
+
+    def isComplete(self, job):
+        entry = self.entries.get(self._getJobKey(job))
+        if entry is None:
+            return False
+        if not os.path.exists(job["path"]) or not os.path.exists(entry["outputPath"]):
+            return False
+        if _stampPath(entry["outputPath"]) != entry["outputStamp"]:
+            return False
+        return _stampPath(job["path"]) == entry.get("inputStamp")
+
+    def complete(self, job, outputPath):
+        """record a completed job. this may be called from any thread."""
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            try:
+                entry = dict(
+                    inputPath=job["path"],
+                    inputStamp=_stampPath(job["path"]),
+                    outputPath=outputPath,
+                    outputStamp=_stampPath(outputPath),
+                    date=time.strftime("%Y-%m-%d %H:%M:%S")
+                )
+                self.entries[self._getJobKey(job)] = entry
+                self.save()
+            except (IOError, OSError), error:
+                # the job will be run again when resuming
+                self.errors.append("%s: %s" % (os.path.basename(job["path"]), error))
+        finally:
+            if self._lock is not None:
+                self._lock.release()
+
+    def save(self):
+        # write the journal next to the old one and replace
+        # it so that it can't be left half written
+        tempPath = _getStagingPath(self.path)
+        writePlist(dict(jobs=self.entries), tempPath)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tempPath, self.path)
+
+    def remove(self):
+        """remove the journal once the batch is complete"""
+        self.entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# -------
+# Batches
+# -------
+
+_jobOptionDefaults = {
+    "export" : dict(newFile=True, closeFile=True, doInfo=True, doKerning=True, doGroups=True, doLib=True, doFeatures=True,
+        doHints=False, doMarks=True, doMasks=True, glyphs=None, formatVersion=2, onlyChangedGlyphs=False, compactMasks=False,
+        addComponentBases=False, subsetKerning=False),
+    "import" : dict(newFile=True, saveFile=True, closeFile=True, doInfo=True, doKerning=True, doGroups=True, doLib=True, doFeatures=True,
+        doHints=False, doMarks=True, doMasks=True, glyphs=None, onlyChangedGlyphs=False, chunkSize=500,
+        addComponentBases=False)
+}
+
+def _normalizeJob(job):
+    # validate the job and fill in the default options
+    mode = job.get("mode")
+    if mode not in _jobOptionDefaults:
+        raise ValueError("Unknown job mode: %r" % mode)
+    if not job.get("path"):
+        raise ValueError("A path is required for each job.")
+    normalized = dict(_jobOptionDefaults[mode])
+    for key, value in job.items():
+        key = str(key)
+        if key not in normalized and key not in ("mode", "path", "font"):
+            raise ValueError("Unknown %s job option: %s" % (mode, key))
+        normalized[key] = value
+    return normalized
+
+def readJobFile(path):
+    """
+    Read a job file. This is a plist containing either a
+    list of jobs or a dictionary with a "jobs" list and an
+    optional "defaults" dictionary that is applied to each
+    job. Each job is a dictionary with a "mode" ("import" or
+    "export"), a "path" (the UFO to import or the VFB to
+    export) and any of the exportUFO/importUFO options.
+    Relative paths are relative to the job file.
+    """
+    data = readPlist(path)
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get("defaults", {})
+        data = data.get("jobs", [])
+    directory = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for job in data:
+        d = dict(defaults)
+        d.update(job)
+        if d.get("path"):
+            d["path"] = os.path.normpath(os.path.join(directory, d["path"]))
+        jobs.append(_normalizeJob(d))
+    return jobs
+
+def runJob(job, backend=None, pipeline=None, snapshot=None, journal=None):
+    """run a single export or import job"""
+    if backend is None:
+        backend = FontLabBackend()
+    job = _normalizeJob(job)
+    mode = job["mode"]
+    path = job["path"]
+    options = {}
+    for key in _jobOptionDefaults[mode].keys():
+        options[key] = job[key]
+    if mode == "export":
+        closeFile = options.pop("closeFile")
+        font = job.get("font")
+        openedFont = False
+        if font is None:
+            font, openedFont = backend.findOrOpenFont(path)
+        if font is None:
+            backend.message("Could not find the FontLab file \"%s\"." % os.path.basename(path))
+            return
+        callback = None
+        if journal is not None:
+            def callback(ufoPath):
+                journal.complete(job, ufoPath)
+        exportUFO(font, backend=backend, pipeline=pipeline, callback=callback, **options)
+        # only close fonts that were opened for this job
+        if openedFont and closeFile:
+            backend.closeFont(font)
+    else:
+        vfbPath = importUFO(path, backend=backend, snapshot=snapshot, **options)
+        # imports that aren't saved can't be resumed
+        if journal is not None and vfbPath is not None:
+            journal.complete(job, vfbPath)
+
+def _findParsableJobs(jobs):
+    # the import jobs that can be parsed ahead of time.
+    # imports of changed glyphs depend on the font and
+    # UFOs that are exported in the batch can't be read
+    # before they are written.
+    exportedUFOs = set()
+    for job in jobs:
+        if job["mode"] == "export":
+            exportedUFOs.add(os.path.splitext(job["path"])[0] + ".ufo")
+    parsable = []
+    for index, job in enumerate(jobs):
+        if job["mode"] != "import":
+            continue
+        if job["onlyChangedGlyphs"] and not job["newFile"]:
+            continue
+        if job["path"] in exportedUFOs:
+            continue
+        parsable.append(index)
+    return parsable
+
+def runJobs(jobs, backend=None, timer=None, parseWorkers=2, processes=False, journal=None, progress=None):
+    """
+    Run a list of export and import jobs without any interface.
+    If a PhaseTimer is given the time spent on each phase of
+    each job is recorded in it. The exports are written in
+    an ExportPipeline while the next font is being copied.
+    The UFOs to import are parsed ahead by an ImportParser
+    with parseWorkers workers, which are processes if
+    processes is True. If a BatchJournal is given the jobs
+    it has recorded as complete are skipped, the completed
+    jobs are recorded in it and it is removed when all jobs
+    have been run. If a BatchProgress is given the progress
+    is reported to it and the batch can be cancelled with
+    it, in which case BatchCancelled is raised.
+    """
+    if backend is None:
+        backend = FontLabBackend()
+    if timer is not None:
+        backend.timer = timer
+    if progress is not None:
+        backend.progress = progress
+    jobs = [_normalizeJob(job) for job in jobs]
+    if journal is not None:
+        jobs = [job for job in jobs if not journal.isComplete(job)]
+    parsable = _findParsableJobs(jobs)
+    parser = None
+    if len(parsable) > 1:
+        parser = ImportParser(workers=parseWorkers, processes=processes)
+    def submitNext():
+        index = parsable.pop(0)
+        job = jobs[index]
+        glyphs = job["glyphs"]
+        if glyphs is not None and job["addComponentBases"]:
+            glyphs = _addUFOComponentBases(job["path"], glyphs)
+        parser.submit(index, job["path"], doInfo=job["doInfo"], doKerning=job["doKerning"],
+            doGroups=job["doGroups"], doFeatures=job["doFeatures"], glyphs=glyphs, maxGlyphs=job["chunkSize"])
+        return index
+    submitted = set()
+    def finishWorkers():
+        # the exports that have been copied are written
+        # even if the batch has been cancelled
+        try:
+            if pipeline is not None:
+                pipeline.finish()
+        finally:
+            if parser is not None:
+                parser.finish()
+    backend.timer.beginBatch()
+    backend.progress.beginBatch(len(jobs), backend)
+    pipeline = None
+    failed = True
+    try:
+        try:
+            # only a few parsed UFOs are kept in memory
+            if parser is not None:
+                while parsable and len(submitted) <= parseWorkers:
+                    submitted.add(submitNext())
+            for index, job in enumerate(jobs):
+                backend.progress.checkCancelled()
+                snapshot = None
+                if job["mode"] == "export":
+                    if pipeline is None:
+                        pipeline = ExportPipeline(timer=backend.timer)
+                else:
+                    if pipeline is not None:
+                        # the UFO may still be being written
+                        pipeline.finish()
+                        pipeline = None
+                    if index in submitted:
+                        snapshot = parser.get(index)
+                        submitted.remove(index)
+                        if parsable:
+                            submitted.add(submitNext())
+                backend.progress.beginJob(job["path"])
+                runJob(job, backend=backend, pipeline=pipeline, snapshot=snapshot, journal=journal)
+                backend.progress.endJob()
+        except:
+            # an error from writing the exports is reported
+            # without replacing the one that stopped the batch
+            errorType, error, errorTraceback = sys.exc_info()
+            try:
+                finishWorkers()
+            except Exception, finishError:
+                backend.message("The exports could not all be written: %s" % finishError)
+            raise errorType, error, errorTraceback
+        finishWorkers()
+        failed = False
+    finally:
+        backend.timer.endBatch()
+        backend.progress.endBatch(failed=failed)
+        if journal is not None and journal.errors:
+            backend.message("These files could not be recorded in the journal:\n" + "\n".join(journal.errors))
+    if journal is not None:
+        journal.remove()
+
+def runJobFile(path, backend=None, timer=None, resume=False):
+    """
+    Run the jobs in a job file. The completed jobs are recorded
+    in a journal next to the job file. If resume is True the
+    jobs completed before the last run was interrupted are
+    skipped. The progress is written to a log file next to
+    the job file and the batch is cancelled if a file with
+    the name of the job file and a .cancel extension appears.
+    """
+    basePath = os.path.splitext(path)[0]
+    journal = BatchJournal(basePath + ".journal.plist", resume=resume)
+    progress = BatchProgress(logPath=basePath + ".log", cancelPath=basePath + ".cancel")
+    runJobs(readJobFile(path), backend=backend, timer=timer, journal=journal, progress=progress)
 
 
 if __name__ == "__main__":
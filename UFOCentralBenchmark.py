@@ -0,0 +1,353 @@
+"""
+UFO Central Benchmark
+Version 1.0
+
+Measure how the UFO Central export and import code scales.
+Synthetic fonts of a given size are built in memory and run
+through exportUFO and importUFO with a stand-in backend, so
+this can be run with any Python that has RoboFab, inside or
+outside of FontLab.
+
+    python UFOCentralBenchmark.py --glyphs 2000 --output results.plist
+
+Each phase is run a number of times and the best time is
+used to calculate the glyphs per second. The results are
+written as a plist so that runs made with different versions
+of UFO Central can be compared.
+"""
+
+import os
+import sys
+import re
+import time
+import random
+import shutil
+import tempfile
+from robofab.objects.objectsRF import RFont
+from robofab.plistlib import writePlist
+import UFOCentral
+from UFOCentral import FontBackend, InstructionPointPen, instructionsDrawPoints, GlyphSelectionModel,\
+    PhaseTimer, exportUFO, importUFO
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+RESULTS_FORMAT_VERSION = 2
+
+# ---------
+# Stand-ins
+# ---------
+
+class BenchmarkFont(RFont):
+
+    """
+    An in memory font that behaves enough like a
+    FontLab font for exportUFO and importUFO.
+    The mask of each glyph is a list of contours
+    stored in glyph.mask.
+    """
+
+    def _get_path(self):
+        return self._path
+
+    def _set_path(self, path):
+        self._path = path
+
+    path = property(_get_path, _set_path, doc="path of the font")
+
+    def newGlyph(self, glyphName, clear=True):
+        glyph = RFont.newGlyph(self, glyphName, clear=clear)
+        glyph.mark = 0
+        glyph.mask = None
+        return glyph
+
+    def save(self, path=None):
+        # there is no VFB to write
+        if path is not None:
+            self.path = path
+
+    def close(self):
+        pass
+
+
+class BenchmarkBackend(FontBackend):
+
+    def __init__(self, fonts=None):
+        super(BenchmarkBackend, self).__init__()
+        if fonts is None:
+            fonts = []
+        self.fonts = list(fonts)
+
+    def allFonts(self):
+        return list(self.fonts)
+
+    def currentFont(self):
+        if self.fonts:
+            return self.fonts[-1]
+        return None
+
+    def openFont(self, path):
+        for font in self.fonts:
+            if font.path == path:
+                return font
+        raise IOError("The benchmark can not open files from disk: %s" % path)
+
+    def newFont(self):
+        font = BenchmarkFont()
+        self.fonts.append(font)
+        return font
+
+    def hasMask(self, glyph):
+        return glyph.mask is not None
+
+    def readMask(self, glyph, pointPen):
+        instructionsDrawPoints(glyph.mask, pointPen)
+
+    def writeMask(self, glyph, instructions):
+        pen = InstructionPointPen()
+        instructionsDrawPoints(instructions, pen)
+        glyph.mask = pen.getContours()
+
+# ---------------
+# Synthetic Fonts
+# ---------------
+
+def _drawSyntheticContour(pointPen, randomizer, pointCount):
+    # a closed contour of alternating lines and curves
+    pointPen.beginPath()
+    centerX = randomizer.randint(100, 900)
+    centerY = randomizer.randint(100, 700)
+    for index in range(pointCount):
+        x = centerX + randomizer.randint(-100, 100)
+        y = centerY + randomizer.randint(-100, 100)
+        if index % 3 == 0:
+            pointPen.addPoint((x, y), segmentType="line", smooth=False)
+        elif index % 3 == 1:
+            pointPen.addPoint((x, y))
+        else:
+            pointPen.addPoint((x, y))
+            pointPen.addPoint((x + 10, y + 10), segmentType="curve", smooth=True)
+    pointPen.endPath()
+
+def makeSyntheticFont(path, glyphCount=500, contoursPerGlyph=3, pointsPerContour=9, maskDensity=0.1,
+    kerningPairs=1000, groupCount=20, groupSize=10, seed=0):
+    """
+    Make a font filled with random data. maskDensity is the
+    fraction of the glyphs that have a mask. The same seed
+    always makes the same font.
+    """
+    randomizer = random.Random(seed)
+    font = BenchmarkFont()
+    font.path = path
+    font.info.familyName = "Benchmark"
+    font.info.styleName = "Regular"
+    font.info.unitsPerEm = 1000
+    glyphNames = []
+    for index in range(glyphCount):
+        glyphName = "glyph%05d" % index
+        glyphNames.append(glyphName)
+        glyph = font.newGlyph(glyphName)
+        glyph.width = randomizer.randint(200, 1000)
+        glyph.unicode = 0xE000 + index
+        glyph.mark = randomizer.randint(0, 255)
+        pointPen = glyph.getPointPen()
+        for i in range(contoursPerGlyph):
+            _drawSyntheticContour(pointPen, randomizer, pointsPerContour)
+        if randomizer.random() < maskDensity:
+            maskPen = InstructionPointPen()
+            for i in range(contoursPerGlyph):
+                _drawSyntheticContour(maskPen, randomizer, pointsPerContour)
+            glyph.mask = maskPen.getContours()
+    groupNames = []
+    for index in range(groupCount):
+        groupName = "@group%03d" % index
+        groupNames.append(groupName)
+        font.groups[groupName] = randomizer.sample(glyphNames, min(groupSize, len(glyphNames)))
+    kerningSides = glyphNames + groupNames
+    kerning = {}
+    # there can't be more pairs than there are combinations of sides
+    kerningPairs = min(kerningPairs, len(kerningSides) ** 2)
+    while len(kerning) < kerningPairs:
+        pair = (randomizer.choice(kerningSides), randomizer.choice(kerningSides))
+        kerning[pair] = randomizer.randint(-100, 100)
+    font.kerning.update(kerning)
+    return font
+
+# ------
+# Phases
+# ------
+
+def _peakMemory():
+    # the peak memory use of the process in bytes
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, mac os x bytes
+    if sys.platform != "darwin":
+        peak = peak * 1024
+    return peak
+
+def _runPhase(name, function, glyphCount, repeat, setup=None):
+    peakBefore = _peakMemory()
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    best = min(times)
+    result = dict(name=name, times=times, best=best, glyphs=glyphCount)
+    if best > 0:
+        result["glyphsPerSecond"] = glyphCount / best
+    # the peak is kept for the whole process, so only the amount
+    # a phase raised it by can be traced to that phase. phases
+    # that stay below an earlier peak report 0.
+    if peakBefore is not None:
+        result["peakMemoryIncrease"] = _peakMemory() - peakBefore
+    return result
+
+def _flattenPhaseTimer(timer):
+    # the totals for all runs of each phase, by file
+    phases = []
+    for key, phase, duration, calls, glyphCount in timer.getRecords():
+        phases.append(dict(file=os.path.basename(key), name=phase, time=duration, calls=calls, glyphs=glyphCount))
+    return phases
+
+def _ufoCentralVersion():
+    m = re.search(r"Version\s+(\S+)", UFOCentral.help)
+    if m is None:
+        return "unknown"
+    return m.group(1)
+
+def runBenchmark(glyphCount=500, contoursPerGlyph=3, pointsPerContour=9, maskDensity=0.1,
+    kerningPairs=1000, groupCount=20, groupSize=10, repeat=3, seed=0, verbose=True):
+    """run all phases and return the results as a dictionary"""
+    parameters = dict(glyphCount=glyphCount, contoursPerGlyph=contoursPerGlyph, pointsPerContour=pointsPerContour,
+        maskDensity=maskDensity, kerningPairs=kerningPairs, groupCount=groupCount, groupSize=groupSize,
+        repeat=repeat, seed=seed)
+    phases = []
+    directory = tempfile.mkdtemp()
+    try:
+        vfbPath = os.path.join(directory, "Benchmark.vfb")
+        ufoPath = os.path.join(directory, "Benchmark.ufo")
+        holder = {}
+        def generate():
+            holder["font"] = makeSyntheticFont(vfbPath, glyphCount=glyphCount, contoursPerGlyph=contoursPerGlyph,
+                pointsPerContour=pointsPerContour, maskDensity=maskDensity, kerningPairs=kerningPairs,
+                groupCount=groupCount, groupSize=groupSize, seed=seed)
+        def removeUFO():
+            if os.path.exists(ufoPath):
+                shutil.rmtree(ufoPath)
+        def export():
+            exportUFO(font, newFile=True, backend=backend)
+        def exportCompactMasks():
+            exportUFO(font, newFile=True, compactMasks=True, backend=backend)
+        def exportUnchanged():
+            exportUFO(font, newFile=False, onlyChangedGlyphs=True, backend=backend)
+        def seedExportManifest():
+            removeUFO()
+            exportUFO(font, newFile=True, backend=backend)
+            exportUFO(font, newFile=False, onlyChangedGlyphs=True, backend=backend)
+        def import_():
+            importBackend = BenchmarkBackend()
+            importBackend.timer = timer
+            importUFO(ufoPath, newFile=True, saveFile=False, closeFile=False, backend=importBackend)
+        def importUnchanged():
+            importUFO(ufoPath, newFile=False, saveFile=False, closeFile=False, onlyChangedGlyphs=True, backend=backend)
+        def instructionPointPen():
+            for glyphName in glyphNames:
+                pen = InstructionPointPen()
+                font[glyphName].drawPoints(pen)
+                contours[glyphName] = pen.getContours()
+        def drawInstructions():
+            for glyphName in glyphNames:
+                instructionsDrawPoints(contours[glyphName], InstructionPointPen())
+        def glyphSelection():
+            model = GlyphSelectionModel(glyphNames, [])
+            model.select(glyphNames[::2])
+            model.setFilter("*1*")
+            model.getVisibleSelected()
+            model.getVisibleUnselected()
+            model.setFilter("U+E000-U+E0FF")
+            model.getVisibleSelected()
+            model.setFilter("")
+            model.selectAll()
+            model.deselect(glyphNames[1::2])
+            model.deselectAll()
+
+        phases.append(_runPhase("generate", generate, glyphCount, repeat))
+        font = holder["font"]
+        glyphNames = font.keys()
+        glyphNames.sort()
+        backend = BenchmarkBackend([font])
+        # the phases inside of exportUFO and importUFO
+        timer = PhaseTimer()
+        backend.timer = timer
+        contours = {}
+        phases.append(_runPhase("export", export, glyphCount, repeat, setup=removeUFO))
+        phases.append(_runPhase("exportCompactMasks", exportCompactMasks, glyphCount, repeat, setup=removeUFO))
+        seedExportManifest()
+        phases.append(_runPhase("exportUnchanged", exportUnchanged, glyphCount, repeat))
+        phases.append(_runPhase("import", import_, glyphCount, repeat))
+        importUFO(ufoPath, newFile=False, saveFile=False, closeFile=False, onlyChangedGlyphs=True, backend=backend)
+        phases.append(_runPhase("importUnchanged", importUnchanged, glyphCount, repeat))
+        phases.append(_runPhase("instructionPointPen", instructionPointPen, glyphCount, repeat))
+        phases.append(_runPhase("instructionsDrawPoints", drawInstructions, glyphCount, repeat))
+        phases.append(_runPhase("glyphSelection", glyphSelection, glyphCount, repeat))
+    finally:
+        shutil.rmtree(directory, True)
+    results = dict(
+        formatVersion=RESULTS_FORMAT_VERSION,
+        ufoCentralVersion=_ufoCentralVersion(),
+        pythonVersion=sys.version.split()[0],
+        platform=sys.platform,
+        date=time.strftime("%Y-%m-%d %H:%M:%S"),
+        parameters=parameters,
+        phases=phases,
+        pipelinePhases=_flattenPhaseTimer(timer)
+    )
+    peak = _peakMemory()
+    if peak is not None:
+        results["peakMemory"] = peak
+    if verbose:
+        printResults(results)
+    return results
+
+def printResults(results):
+    print "UFO Central %s, Python %s" % (results["ufoCentralVersion"], results["pythonVersion"])
+    print "%-24s %10s %12s %14s" % ("phase", "best (s)", "glyphs/sec", "peak rise (MB)")
+    for phase in results["phases"]:
+        print "%-24s %10.4f %12.1f %14.1f" % (phase["name"], phase["best"], phase.get("glyphsPerSecond", 0),
+            phase.get("peakMemoryIncrease", 0) / 1048576.0)
+    print
+    print "%-24s %-16s %10s %8s" % ("pipeline phase", "file", "total (s)", "calls")
+    for phase in results["pipelinePhases"]:
+        print "%-24s %-16s %10.4f %8d" % (phase["name"], phase["file"], phase["time"], phase["calls"])
+    if "peakMemory" in results:
+        print "peak memory: %.1f MB" % (results["peakMemory"] / 1048576.0)
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--glyphs", type="int", dest="glyphCount", default=500)
+    parser.add_option("--contours", type="int", dest="contoursPerGlyph", default=3)
+    parser.add_option("--points", type="int", dest="pointsPerContour", default=9)
+    parser.add_option("--mask-density", type="float", dest="maskDensity", default=0.1)
+    parser.add_option("--kerning", type="int", dest="kerningPairs", default=1000)
+    parser.add_option("--groups", type="int", dest="groupCount", default=20)
+    parser.add_option("--group-size", type="int", dest="groupSize", default=10)
+    parser.add_option("--repeat", type="int", dest="repeat", default=3)
+    parser.add_option("--seed", type="int", dest="seed", default=0)
+    parser.add_option("--output", dest="output", default=None,
+        help="write the results to this plist")
+    options, args = parser.parse_args()
+    results = runBenchmark(glyphCount=options.glyphCount, contoursPerGlyph=options.contoursPerGlyph,
+        pointsPerContour=options.pointsPerContour, maskDensity=options.maskDensity,
+        kerningPairs=options.kerningPairs, groupCount=options.groupCount, groupSize=options.groupSize,
+        repeat=options.repeat, seed=options.seed)
+    if options.output:
+        writePlist(results, options.output)